@@ -1,22 +1,688 @@
-from flask import Flask, render_template_string, request, jsonify, send_file, session
+from flask import Flask, render_template_string, request, jsonify, send_file, session, g, stream_with_context
+import click
 from datetime import datetime, date, timedelta
 import json
+import logging
+import math
+import multiprocessing
 import os
+import queue
+import re
 import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from werkzeug.utils import secure_filename
+import base64
 import csv
+import hashlib
 import io
-from functools import wraps
+from collections import OrderedDict, defaultdict
+from functools import lru_cache, wraps
 
 app = Flask(__name__)
+app.logger.setLevel(logging.INFO)
 app.secret_key = 'your-secret-key-change-this-in-production'
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['DATABASE'] = os.environ.get('EXPENSES_DB', 'expenses.db')
+app.config['DB_POOL_SIZE'] = int(os.environ.get('EXPENSES_DB_POOL_SIZE', 8))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get('EXPENSES_DB_POOL_TIMEOUT', 10))
+app.config['DB_PROFILE'] = os.environ.get('EXPENSES_DB_PROFILE', 'read-heavy')
+app.config['ANALYTICS_MAX_POINTS'] = int(os.environ.get('EXPENSES_ANALYTICS_MAX_POINTS', 120))
+app.config['RESULT_CACHE_MAX_BYTES'] = int(os.environ.get('EXPENSES_RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+app.config['PAGE_SIZE'] = 50
+app.config['MAX_PAGE_SIZE'] = 500
+app.config['BATCH_MAX_ITEMS'] = 10000
+app.config['IMPORT_BATCH_SIZE'] = 1000
+app.config['IMPORT_MAX_REJECTS_REPORTED'] = 100
+app.config['IMPORT_WORKERS'] = int(os.environ.get('EXPENSES_IMPORT_WORKERS', 2))
+# Per app process: every gunicorn worker starts its own parse pool
+app.config['IMPORT_PARSE_PROCESSES'] = int(os.environ.get('EXPENSES_IMPORT_PARSE_PROCESSES', min(os.cpu_count() or 2, 4)))
+app.config['IMPORT_POLL_INTERVAL'] = 1.0
+# A running job whose heartbeat is older than this belongs to a dead process
+app.config['IMPORT_LEASE_SECONDS'] = 60.0
+app.config['MERCHANT_MATCH_THRESHOLD'] = 0.8
+app.config['SNAPSHOT_STEP_PAGES'] = 256
+app.config['SNAPSHOT_STEP_SLEEP'] = 0.005
+# Whole-database restores replace every profile; off by default outside the CLI
+app.config['SNAPSHOT_HTTP_FULL_RESTORE'] = os.environ.get('EXPENSES_SNAPSHOT_HTTP_FULL_RESTORE') == '1'
 
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# SQLite engine presets, applied as PRAGMAs on every new connection. Both use WAL
+# so /api/analytics readers never block /api/expenses writers (and vice versa);
+# synchronous=NORMAL is durable across application crashes under WAL.
+#   read-heavy  - dashboard/analytics traffic dominates: large page cache and
+#                 mmap window so repeated aggregate scans are served from memory.
+#   write-heavy - imports and bulk entry dominate: smaller cache/mmap per
+#                 connection and a longer busy timeout so concurrent writers queue
+#                 for the lock instead of failing with "database is locked".
+# Select one with EXPENSES_DB_PROFILE and override single pragmas with
+# EXPENSES_DB_<PRAGMA>, e.g. EXPENSES_DB_MMAP_SIZE=0 or EXPENSES_DB_SYNCHRONOUS=FULL.
+DB_PRESETS = {
+    'read-heavy': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'write-heavy': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+}
+
+def db_pragmas():
+    profile = app.config['DB_PROFILE']
+    if profile not in DB_PRESETS:
+        raise ValueError(f'Unknown EXPENSES_DB_PROFILE {profile!r}, expected one of {sorted(DB_PRESETS)}')
+    pragmas = dict(DB_PRESETS[profile])
+    for name in pragmas:
+        override = app.config.get(f'DB_{name.upper()}', os.environ.get(f'EXPENSES_DB_{name.upper()}'))
+        if override is not None:
+            pragmas[name] = override
+    return pragmas
+
+@lru_cache(maxsize=256)
+def compile_regexp(pattern):
+    return re.compile(pattern, re.IGNORECASE)
+
+def sqlite_regexp(pattern, value):
+    # Backs the `value REGEXP pattern` operator, case-insensitively
+    return value is not None and compile_regexp(pattern).search(value) is not None
+
+def connect_db():
+    conn = sqlite3.connect(app.config['DATABASE'], check_same_thread=False)
+    for name, value in db_pragmas().items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    conn.create_function('regexp', 2, sqlite_regexp, deterministic=True)
+    return conn
+
+def effective_pragmas(conn):
+    return {name: conn.execute(f'PRAGMA {name}').fetchone()[0] for name in DB_PRESETS['read-heavy']}
+
+class PoolTimeout(Exception):
+    pass
+
+class ConnectionPool:
+    # Bounded pool of long-lived SQLite connections shared by the worker's threads.
+    # Connections are created lazily up to `size`; once that many are checked out,
+    # callers wait up to `timeout` seconds for one to be returned.
+
+    def __init__(self, factory, size, timeout):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._stats = {'checkouts': 0, 'waits': 0, 'wait_time': 0.0, 'timeouts': 0,
+                       'created': 0, 'discarded': 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _create(self):
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+        self._count('created')
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._count('discarded')
+
+    def acquire(self):
+        # Connections must never cross a fork (e.g. gunicorn --preload)
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._reset()
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._open < self.size
+                if can_create:
+                    self._open += 1
+            if can_create:
+                conn = self._create()
+            else:
+                self._count('waits')
+                started = time.monotonic()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._count('timeouts')
+                    raise PoolTimeout(f'No database connection available after {self.timeout}s')
+                self._count('wait_time', time.monotonic() - started)
+
+        if not self._healthy(conn):
+            self._discard(conn)
+            conn = self._create()
+
+        self._count('checkouts')
+        return conn
+
+    def release(self, conn):
+        if os.getpid() != self._pid:
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            conn = self._create()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['open'] = self._open
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['size'] = self.size
+        stats['wait_time'] = round(stats['wait_time'], 4)
+        return stats
+
+pool = ConnectionPool(connect_db, app.config['DB_POOL_SIZE'], app.config['DB_POOL_TIMEOUT'])
+
+def get_db():
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+@app.errorhandler(PoolTimeout)
+def pool_timeout(e):
+    return jsonify({'error': str(e)}), 503
+
+# Daily rollups of expenses and income. Every writer updates them in the same
+# transaction as the raw rows, so summary()/analytics() can aggregate per day
+# instead of per transaction.
+def update_expense_rollup(c, profile_id, deltas):
+    # deltas: iterable of (date, category_id, payment_method_id, count, total). Negative
+    # deltas come from edits and deletes; a row whose count reaches zero is removed.
+    rows = [(profile_id, d, cat or 0, method or 0, n, total) for d, cat, method, n, total in deltas]
+    c.executemany('''INSERT INTO expense_daily_rollup (profile_id, date, category_id, payment_method_id, txn_count, total)
+                     VALUES (?, ?, ?, ?, ?, ?)
+                     ON CONFLICT (profile_id, date, category_id, payment_method_id)
+                     DO UPDATE SET txn_count = txn_count + excluded.txn_count, total = total + excluded.total''',
+                  rows)
+    c.executemany('''DELETE FROM expense_daily_rollup
+                     WHERE profile_id = ? AND date = ? AND category_id = ? AND payment_method_id = ? AND txn_count <= 0''',
+                  [row[:4] for row in rows if row[4] < 0])
+
+def update_income_rollup(c, profile_id, deltas):
+    # deltas: iterable of (date, type, count, total); as update_expense_rollup()
+    rows = [(profile_id, d, typ or '', n, total) for d, typ, n, total in deltas]
+    c.executemany('''INSERT INTO income_daily_rollup (profile_id, date, type, txn_count, total)
+                     VALUES (?, ?, ?, ?, ?)
+                     ON CONFLICT (profile_id, date, type)
+                     DO UPDATE SET txn_count = txn_count + excluded.txn_count, total = total + excluded.total''',
+                  rows)
+    c.executemany('DELETE FROM income_daily_rollup WHERE profile_id = ? AND date = ? AND type = ? AND txn_count <= 0',
+                  [row[:3] for row in rows if row[3] < 0])
+
+def rebuild_rollups(c, profile_id=None):
+    where, params = ('WHERE profile_id = ?', (profile_id,)) if profile_id is not None else ('', ())
+    c.execute(f'DELETE FROM expense_daily_rollup {where}', params)
+    c.execute(f'''INSERT INTO expense_daily_rollup (profile_id, date, category_id, payment_method_id, txn_count, total)
+                  SELECT profile_id, date, COALESCE(category_id, 0), COALESCE(payment_method_id, 0), COUNT(*), SUM(amount)
+                  FROM expenses {where}
+                  GROUP BY profile_id, date, COALESCE(category_id, 0), COALESCE(payment_method_id, 0)''', params)
+    c.execute(f'DELETE FROM income_daily_rollup {where}', params)
+    c.execute(f'''INSERT INTO income_daily_rollup (profile_id, date, type, txn_count, total)
+                  SELECT profile_id, date, COALESCE(type, ''), COUNT(*), SUM(amount)
+                  FROM income {where}
+                  GROUP BY profile_id, date, COALESCE(type, '')''', params)
+
+def rebuild_text_rollups(c, profile_id=None):
+    # rebuild_rollups() as migration 2 ran it, over the text category and payment
+    # method columns that migration 12 replaced. Frozen, so migration 2 replays as
+    # released on a database older than it; do not use it elsewhere.
+    where, params = ('WHERE profile_id = ?', (profile_id,)) if profile_id is not None else ('', ())
+    c.execute(f'DELETE FROM expense_daily_rollup {where}', params)
+    c.execute(f'''INSERT INTO expense_daily_rollup (profile_id, date, category, payment_method, txn_count, total)
+                  SELECT profile_id, date, COALESCE(category, ''), COALESCE(payment_method, ''), COUNT(*), SUM(amount)
+                  FROM expenses {where}
+                  GROUP BY profile_id, date, COALESCE(category, ''), COALESCE(payment_method, '')''', params)
+    c.execute(f'DELETE FROM income_daily_rollup {where}', params)
+    c.execute(f'''INSERT INTO income_daily_rollup (profile_id, date, type, txn_count, total)
+                  SELECT profile_id, date, COALESCE(type, ''), COUNT(*), SUM(amount)
+                  FROM income {where}
+                  GROUP BY profile_id, date, COALESCE(type, '')''', params)
+
+def normalize_merchant(merchant):
+    return ' '.join(re.findall(r'[0-9a-z]+', (merchant or '').lower()))
+
+def statement_fingerprint(profile_id, card_name, date_str, amount, merchant, occurrence):
+    # occurrence numbers identical rows within one statement (two same-day coffees of
+    # the same amount), so a re-upload matches row for row while both originals stay.
+    key = f'{profile_id}\x1f{card_name}\x1f{date_str}\x1f{amount:.2f}\x1f{normalize_merchant(merchant)}\x1f{occurrence}'
+    return hashlib.blake2b(key.encode(), digest_size=16).digest()
+
+def assign_fingerprints(c, profile_id=None):
+    where, params = ('WHERE profile_id = ?', (profile_id,)) if profile_id is not None else ('', ())
+    c.execute(f'SELECT id, profile_id, card_name, date, amount, merchant FROM credit_statements {where} ORDER BY id',
+              params)
+    seen = defaultdict(int)
+    updates = []
+    for row_id, pid, card_name, date_str, amount, merchant in c.fetchall():
+        key = (pid, card_name, date_str, round(amount or 0, 2), normalize_merchant(merchant))
+        updates.append((statement_fingerprint(pid, card_name, date_str, amount or 0, merchant, seen[key]), row_id))
+        seen[key] += 1
+    c.executemany('UPDATE credit_statements SET fingerprint = ? WHERE id = ?', updates)
+
+# Tokens that vary between statement lines of one merchant: order/terminal words,
+# company suffixes and cities
+MERCHANT_NOISE = frozenset('''
+    order orders pos upi txn ref payment payments online pvt ltd private limited llp inc co com www in india
+    bangalore bengaluru mumbai delhi new chennai hyderabad pune kolkata gurgaon gurugram noida ahmedabad
+'''.split())
+
+def merchant_core(alias):
+    # Drops noise words and reference numbers: 'swiggy order 12345' -> 'swiggy'
+    tokens = [token for token in alias.split()
+              if token not in MERCHANT_NOISE and 2 * sum(ch.isdigit() for ch in token) <= len(token)]
+    return ' '.join(tokens) or alias
+
+def trigrams(text):
+    # Word trigrams padded like pg_trgm, so word starts and ends carry weight
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# Posting lists longer than this rank as equally common when picking trigrams to probe
+MERCHANT_POSTINGS_CAP = 64
+
+class MerchantIndex:
+    # Resolves raw statement merchants to canonical merchant ids for one profile.
+    # A raw string seen before is one primary-key lookup in merchant_aliases. A new
+    # one is reduced to its core, then matched exactly or through the trigram
+    # inverted index, reading only the posting lists of the core's rarest trigrams,
+    # never the long ones of word starts like ' sw'. A candidate wins when the Dice
+    # coefficient of the two trigram sets reaches MERCHANT_MATCH_THRESHOLD, so a
+    # truncated or re-spaced name matches, but 'swiggy' and 'swiggy instamart' stay
+    # apart; otherwise a new merchant is created.
+
+    def __init__(self, c, profile_id):
+        self.c = c
+        self.profile_id = profile_id
+        self.resolved = {}
+        self.cores = {}
+        self.grams = {}
+
+    def resolve_many(self, raws):
+        # One alias query and one alias insert per call, however many rows it covers
+        aliases = [normalize_merchant(raw) for raw in raws]
+        missing = {alias for alias in aliases if alias and alias not in self.resolved}
+        if missing:
+            c = self.c
+            c.execute('''SELECT alias, merchant_id FROM merchant_aliases
+                         WHERE profile_id = ? AND alias IN (SELECT value FROM json_each(?))''',
+                      (self.profile_id, json.dumps(sorted(missing))))
+            found = dict(c.fetchall())
+            self.resolved.update(found)
+            new = []
+            # Longest cores first, so a statement's truncated 'starbucks coffe' matches
+            # 'starbucks coffee' rather than becoming the canonical name
+            for core, alias in sorted(((merchant_core(alias), alias) for alias in missing - found.keys()),
+                                      key=lambda item: (-len(item[0]), item)):
+                merchant_id = self.cores.get(core)
+                if merchant_id is None:
+                    merchant_id = self.cores[core] = self._match(core) or self._create(core)
+                self.resolved[alias] = merchant_id
+                new.append((self.profile_id, alias, merchant_id))
+            c.executemany('INSERT INTO merchant_aliases (profile_id, alias, merchant_id) VALUES (?, ?, ?)', new)
+        return [self.resolved.get(alias) for alias in aliases]
+
+    def _match(self, core):
+        c = self.c
+        c.execute('SELECT id FROM merchants WHERE profile_id = ? AND normalized = ?', (self.profile_id, core))
+        row = c.fetchone()
+        if row:
+            return row[0]
+        grams = sorted(trigrams(core))
+        threshold = app.config['MERCHANT_MATCH_THRESHOLD']
+        # A merchant scoring at least the threshold shares `needed` of these trigrams,
+        # so it holds one of any len(grams) - needed + 1 of them: only the rarest are
+        # probed. Posting lengths are counted up to a cap, so a common trigram costs
+        # no more than a rare one to rank, and among capped ones a word's '  s' goes last.
+        needed = math.ceil(threshold * len(grams) / (2 - threshold) - 1e-9)
+        postings = {}
+        for gram in grams:
+            c.execute('''SELECT COUNT(*) FROM (SELECT 1 FROM merchant_trigrams
+                                                WHERE profile_id = ? AND trigram = ? LIMIT ?)''',
+                      (self.profile_id, gram, MERCHANT_POSTINGS_CAP))
+            postings[gram] = c.fetchone()[0]
+        probe = sorted(grams, key=lambda gram: (postings[gram], gram.startswith('  ')))[:len(grams) - needed + 1]
+        # Dice also bounds the candidate's trigram count; the survivors are few enough
+        # to score from their names
+        c.execute(f'''SELECT id, normalized FROM merchants
+                      WHERE id IN (SELECT merchant_id FROM merchant_trigrams
+                                   WHERE profile_id = ? AND trigram IN ({', '.join('?' * len(probe))}))
+                        AND trigram_count BETWEEN ? AND ?''',
+                  (self.profile_id, *probe, needed, len(grams) * (2 - threshold) / threshold + 1e-9))
+        grams = set(grams)
+        best, best_score = None, threshold
+        for merchant_id, normalized in c.fetchall():
+            other = self.grams.get(merchant_id)
+            if other is None:
+                other = self.grams[merchant_id] = trigrams(normalized)
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score >= best_score:
+                best, best_score = merchant_id, score
+        return best
+
+    def _create(self, core):
+        grams = trigrams(core)
+        self.c.execute('''INSERT INTO merchants (profile_id, name, normalized, trigram_count, created_date)
+                          VALUES (?, ?, ?, ?, ?)''',
+                       (self.profile_id, core.title(), core, len(grams), datetime.now().isoformat()))
+        merchant_id = self.c.lastrowid
+        self.grams[merchant_id] = grams
+        self.c.executemany('INSERT INTO merchant_trigrams (profile_id, trigram, merchant_id) VALUES (?, ?, ?)',
+                           [(self.profile_id, gram, merchant_id) for gram in grams])
+        return merchant_id
+
+def canonicalize_statements(c, profile_id=None):
+    where, params = ('WHERE profile_id = ?', (profile_id,)) if profile_id is not None else ('', ())
+    c.execute(f'SELECT id, profile_id, merchant FROM credit_statements {where} ORDER BY id', params)
+    by_profile = defaultdict(list)
+    for row_id, pid, merchant in c.fetchall():
+        by_profile[pid].append((row_id, merchant))
+    for pid, rows in by_profile.items():
+        merchant_ids = MerchantIndex(c, pid).resolve_many(merchant for _, merchant in rows)
+        c.executemany('UPDATE credit_statements SET merchant_id = ? WHERE id = ?',
+                      [(merchant_id, row_id) for (row_id, _), merchant_id in zip(rows, merchant_ids)])
+        bump_data_version(c, pid, 'credit_statements', 'merchants')
+
+def encode_expense_dimensions(c):
+    # One dimension row per distinct (profile, name); expenses keep only its id. A name
+    # never added to the profile's categories (imported, or deleted before deletes were
+    # soft) enters as deleted, so /api/categories lists what it listed before.
+    c.execute('''INSERT INTO categories (profile_id, name, deleted)
+                 SELECT DISTINCT profile_id, category, 1 FROM expenses
+                 WHERE profile_id IS NOT NULL AND category IS NOT NULL
+                 ON CONFLICT (profile_id, name) DO NOTHING''')
+    c.execute('''INSERT INTO payment_methods (profile_id, name)
+                 SELECT DISTINCT profile_id, payment_method FROM expenses
+                 WHERE profile_id IS NOT NULL AND payment_method IS NOT NULL
+                 ON CONFLICT (profile_id, name) DO NOTHING''')
+    c.execute('''UPDATE expenses SET
+                   category_id = (SELECT id FROM categories
+                                  WHERE profile_id = expenses.profile_id AND name = expenses.category),
+                   payment_method_id = (SELECT id FROM payment_methods
+                                        WHERE profile_id = expenses.profile_id AND name = expenses.payment_method)''')
+
+# Ordered schema migrations, applied in place by init_db(). Steps are SQL strings
+# or callables taking a cursor. Never edit a released migration; append a new one.
+MIGRATIONS = [
+    (1, 'Covering indexes for per-profile date range queries', [
+        'CREATE INDEX IF NOT EXISTS idx_expenses_profile_date_category ON expenses (profile_id, date, category, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_profile_date_payment ON expenses (profile_id, date, payment_method, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_income_profile_date ON income (profile_id, date, amount)',
+        'CREATE INDEX IF NOT EXISTS idx_credit_statements_profile_date ON credit_statements (profile_id, date)',
+    ]),
+    (2, 'Daily expense and income rollups', [
+        '''CREATE TABLE IF NOT EXISTS expense_daily_rollup
+           (profile_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            category TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            txn_count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (profile_id, date, category, payment_method)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS income_daily_rollup
+           (profile_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            type TEXT NOT NULL,
+            txn_count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (profile_id, date, type)) WITHOUT ROWID''',
+        rebuild_text_rollups,
+    ]),
+    (3, 'Per-profile data versions for result caching', [
+        '''CREATE TABLE IF NOT EXISTS data_versions
+           (profile_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL)''',
+    ]),
+    (4, 'Per-profile, per-table change counters for ETags', [
+        '''CREATE TABLE IF NOT EXISTS table_versions
+           (profile_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (profile_id, table_name)) WITHOUT ROWID''',
+    ]),
+    # (profile_id, date) plus the implicit rowid orders pages by (date, id)
+    (5, 'Keyset pagination indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_expenses_profile_date_id ON expenses (profile_id, date)',
+        'CREATE INDEX IF NOT EXISTS idx_income_profile_date_id ON income (profile_id, date)',
+    ]),
+    (6, 'Indexes for filtered transaction search', [
+        'CREATE INDEX IF NOT EXISTS idx_expenses_profile_category_date ON expenses (profile_id, category, date)',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_profile_payment_date ON expenses (profile_id, payment_method, date)',
+    ]),
+    # One contentless FTS5 index over expense descriptions and statement merchants.
+    # Rowids interleave both sources (expense id * 2, statement id * 2 + 1) and the
+    # profile is an indexed token, so scoping happens inside the full-text index.
+    (7, 'Full-text search over descriptions and merchants', [
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS transaction_search USING fts5
+           (body, profile, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')''',
+        '''CREATE TRIGGER IF NOT EXISTS expenses_search_insert AFTER INSERT ON expenses BEGIN
+             INSERT INTO transaction_search (rowid, body, profile) VALUES (new.id * 2, new.description, 'p' || new.profile_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS expenses_search_delete AFTER DELETE ON expenses BEGIN
+             INSERT INTO transaction_search (transaction_search, rowid, body, profile)
+             VALUES ('delete', old.id * 2, old.description, 'p' || old.profile_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS expenses_search_update AFTER UPDATE OF description, profile_id ON expenses BEGIN
+             INSERT INTO transaction_search (transaction_search, rowid, body, profile)
+             VALUES ('delete', old.id * 2, old.description, 'p' || old.profile_id);
+             INSERT INTO transaction_search (rowid, body, profile) VALUES (new.id * 2, new.description, 'p' || new.profile_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS credit_statements_search_insert AFTER INSERT ON credit_statements BEGIN
+             INSERT INTO transaction_search (rowid, body, profile) VALUES (new.id * 2 + 1, new.merchant, 'p' || new.profile_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS credit_statements_search_delete AFTER DELETE ON credit_statements BEGIN
+             INSERT INTO transaction_search (transaction_search, rowid, body, profile)
+             VALUES ('delete', old.id * 2 + 1, old.merchant, 'p' || old.profile_id);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS credit_statements_search_update AFTER UPDATE OF merchant, profile_id ON credit_statements BEGIN
+             INSERT INTO transaction_search (transaction_search, rowid, body, profile)
+             VALUES ('delete', old.id * 2 + 1, old.merchant, 'p' || old.profile_id);
+             INSERT INTO transaction_search (rowid, body, profile) VALUES (new.id * 2 + 1, new.merchant, 'p' || new.profile_id);
+           END''',
+        "INSERT INTO transaction_search (rowid, body, profile) SELECT id * 2, description, 'p' || profile_id FROM expenses",
+        "INSERT INTO transaction_search (rowid, body, profile) SELECT id * 2 + 1, merchant, 'p' || profile_id FROM credit_statements",
+    ]),
+    (8, 'Persistent queue for background statement imports', [
+        '''CREATE TABLE IF NOT EXISTS import_jobs
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER,
+            filename TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            payload BLOB,
+            payload_bytes INTEGER,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            rows_rejected INTEGER NOT NULL DEFAULT 0,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            report TEXT,
+            error TEXT,
+            created_date TEXT,
+            started_date TEXT,
+            finished_date TEXT,
+            FOREIGN KEY (profile_id) REFERENCES profiles(id))''',
+        'CREATE INDEX IF NOT EXISTS idx_import_jobs_status ON import_jobs (status, id)',
+        'CREATE INDEX IF NOT EXISTS idx_import_jobs_profile ON import_jobs (profile_id, id)',
+        # Rows written by a job carry its id so a cancelled or failed job can be undone
+        'ALTER TABLE expenses ADD COLUMN import_job_id INTEGER',
+        'ALTER TABLE credit_statements ADD COLUMN import_job_id INTEGER',
+        'CREATE INDEX IF NOT EXISTS idx_expenses_import_job ON expenses (import_job_id) WHERE import_job_id IS NOT NULL',
+        'CREATE INDEX IF NOT EXISTS idx_credit_statements_import_job ON credit_statements (import_job_id) WHERE import_job_id IS NOT NULL',
+    ]),
+    (9, 'Content fingerprints to skip re-imported statement rows', [
+        'ALTER TABLE credit_statements ADD COLUMN fingerprint BLOB',
+        'ALTER TABLE import_jobs ADD COLUMN card_name TEXT',
+        assign_fingerprints,
+        '''CREATE UNIQUE INDEX IF NOT EXISTS idx_credit_statements_fingerprint
+           ON credit_statements (fingerprint) WHERE fingerprint IS NOT NULL''',
+    ]),
+    (10, 'Per-profile merchant categorization rules', [
+        '''CREATE TABLE IF NOT EXISTS category_rules
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('exact', 'prefix', 'keyword', 'regex')),
+            pattern TEXT NOT NULL,
+            category TEXT NOT NULL,
+            priority INTEGER NOT NULL DEFAULT 0,
+            created_date TEXT,
+            FOREIGN KEY (profile_id) REFERENCES profiles(id))''',
+        'CREATE INDEX IF NOT EXISTS idx_category_rules_profile ON category_rules (profile_id)',
+    ]),
+    (11, 'Canonical merchants with aliases and a trigram index', [
+        '''CREATE TABLE IF NOT EXISTS merchants
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            normalized TEXT NOT NULL,
+            trigram_count INTEGER NOT NULL,
+            created_date TEXT,
+            UNIQUE (profile_id, normalized),
+            FOREIGN KEY (profile_id) REFERENCES profiles(id))''',
+        '''CREATE TABLE IF NOT EXISTS merchant_aliases
+           (profile_id INTEGER NOT NULL,
+            alias TEXT NOT NULL,
+            merchant_id INTEGER NOT NULL,
+            PRIMARY KEY (profile_id, alias)) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS merchant_trigrams
+           (profile_id INTEGER NOT NULL,
+            trigram TEXT NOT NULL,
+            merchant_id INTEGER NOT NULL,
+            PRIMARY KEY (profile_id, trigram, merchant_id)) WITHOUT ROWID''',
+        'ALTER TABLE credit_statements ADD COLUMN merchant_id INTEGER',
+        canonicalize_statements,
+        '''CREATE INDEX IF NOT EXISTS idx_credit_statements_profile_date_merchant
+           ON credit_statements (profile_id, date, merchant_id, amount)''',
+    ]),
+    # Expenses store integer ids instead of repeating category and payment method
+    # names; a rename is one dimension row, and indexes and rollups key on integers.
+    (12, 'Integer-keyed category and payment method dimensions', [
+        'ALTER TABLE categories ADD COLUMN deleted INTEGER NOT NULL DEFAULT 0',
+        '''CREATE TABLE IF NOT EXISTS payment_methods
+           (id INTEGER PRIMARY KEY AUTOINCREMENT,
+            profile_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (profile_id, name),
+            FOREIGN KEY (profile_id) REFERENCES profiles(id))''',
+        'ALTER TABLE expenses ADD COLUMN category_id INTEGER REFERENCES categories(id)',
+        'ALTER TABLE expenses ADD COLUMN payment_method_id INTEGER REFERENCES payment_methods(id)',
+        encode_expense_dimensions,
+        'DROP INDEX IF EXISTS idx_expenses_profile_date_category',
+        'DROP INDEX IF EXISTS idx_expenses_profile_date_payment',
+        'DROP INDEX IF EXISTS idx_expenses_profile_category_date',
+        'DROP INDEX IF EXISTS idx_expenses_profile_payment_date',
+        'ALTER TABLE expenses DROP COLUMN category',
+        'ALTER TABLE expenses DROP COLUMN payment_method',
+        'CREATE INDEX idx_expenses_profile_date_category ON expenses (profile_id, date, category_id, amount)',
+        'CREATE INDEX idx_expenses_profile_date_payment ON expenses (profile_id, date, payment_method_id, amount)',
+        'CREATE INDEX idx_expenses_profile_category_date ON expenses (profile_id, category_id, date)',
+        'CREATE INDEX idx_expenses_profile_payment_date ON expenses (profile_id, payment_method_id, date)',
+        'DROP TABLE expense_daily_rollup',
+        '''CREATE TABLE expense_daily_rollup
+           (profile_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            payment_method_id INTEGER NOT NULL,
+            txn_count INTEGER NOT NULL,
+            total REAL NOT NULL,
+            PRIMARY KEY (profile_id, date, category_id, payment_method_id)) WITHOUT ROWID''',
+        rebuild_rollups,
+    ]),
+    (13, 'Heartbeats so jobs left running by a dead process can be reclaimed', [
+        'ALTER TABLE import_jobs ADD COLUMN heartbeat_date TEXT',
+    ]),
+]
+
+def schema_version(c):
+    c.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return c.fetchone()[0]
+
+def migrate_db(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                 (version INTEGER PRIMARY KEY,
+                  description TEXT,
+                  applied_date TEXT)''')
+
+    for version, description, steps in MIGRATIONS:
+        # Each migration is its own write transaction; re-checking the version under
+        # the lock keeps concurrently starting workers from applying it twice.
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(c) >= version:
+                conn.rollback()
+                continue
+            for step in steps:
+                if callable(step):
+                    step(c)
+                else:
+                    c.execute(step)
+            c.execute('INSERT INTO schema_version (version, description, applied_date) VALUES (?, ?, ?)',
+                      (version, description, datetime.now().isoformat()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        app.logger.info('Applied schema migration %d: %s', version, description)
+
 def init_db():
-    conn = sqlite3.connect('expenses.db')
+    conn = connect_db()
     c = conn.cursor()
 
     c.execute('''CREATE TABLE IF NOT EXISTS profiles
@@ -72,6 +738,8 @@ def init_db():
                   uploaded_date TEXT,
                   FOREIGN KEY (profile_id) REFERENCES profiles (id))''')
 
+    migrate_db(conn)
+
     # Create default profiles if none exist
     c.execute('SELECT COUNT(*) FROM profiles')
     if c.fetchone()[0] == 0:
@@ -80,24 +748,524 @@ def init_db():
             c.execute('INSERT INTO profiles (name, theme, created_date) VALUES (?, ?, ?)',
                       (profile, 'modern', datetime.now().isoformat()))
 
-    # Add default categories for each profile
-    c.execute('SELECT id FROM profiles')
+    # Add default categories to profiles that have none yet. Only then: a default the
+    # user renamed must not come back on the next start.
+    c.execute('SELECT id FROM profiles WHERE NOT EXISTS (SELECT 1 FROM categories WHERE profile_id = profiles.id)')
     profiles = c.fetchall()
     defaults = ['Food', 'Transport', 'Utilities', 'Entertainment', 'Shopping', 'Healthcare', 'Miscellaneous']
     for profile_id, in profiles:
-        for cat in defaults:
-            c.execute('SELECT COUNT(*) FROM categories WHERE profile_id = ? AND name = ?', (profile_id, cat))
-            if c.fetchone()[0] == 0:
-                c.execute('INSERT INTO categories (profile_id, name) VALUES (?, ?)', (profile_id, cat))
+        c.executemany('INSERT INTO categories (profile_id, name) VALUES (?, ?)',
+                      [(profile_id, cat) for cat in defaults])
 
     conn.commit()
+    app.logger.info('SQLite engine profile %s: %s', app.config['DB_PROFILE'],
+                    ', '.join(f'{k}={v}' for k, v in effective_pragmas(conn).items()))
     conn.close()
 
-init_db()
+# Parse processes import this module too; only the app process owns the schema
+if multiprocessing.parent_process() is None:
+    init_db()
 
 def get_profile_id():
     return session.get('profile_id', 1)
 
+# Every write to a profile's data bumps its data version, and the change counter of
+# each table it touched, in the same transaction. Cached results and ETags are keyed
+# on these versions, so stale data is never served, even by another worker process.
+def bump_data_version(c, profile_id, *tables):
+    c.execute('''INSERT INTO data_versions (profile_id, version) VALUES (?, 1)
+                 ON CONFLICT (profile_id) DO UPDATE SET version = version + 1''', (profile_id,))
+    c.executemany('''INSERT INTO table_versions (profile_id, table_name, version) VALUES (?, ?, 1)
+                     ON CONFLICT (profile_id, table_name) DO UPDATE SET version = version + 1''',
+                  [(profile_id, table) for table in tables])
+
+def table_versions(c, profile_id, tables):
+    c.execute(f'''SELECT table_name, version FROM table_versions
+                  WHERE profile_id = ? AND table_name IN ({', '.join('?' * len(tables))})''',
+              (profile_id, *tables))
+    versions = dict(c.fetchall())
+    return tuple(versions.get(table, 0) for table in tables)
+
+def data_version(c, profile_id):
+    c.execute('SELECT version FROM data_versions WHERE profile_id = ?', (profile_id,))
+    row = c.fetchone()
+    return row[0] if row else 0
+
+def conditional_get(*tables):
+    # Strong ETag from the change counters of the tables a GET reads; a matching
+    # If-None-Match is answered with 304 before the view touches any rows.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+            profile_id = get_profile_id()
+            versions = table_versions(get_db().cursor(), profile_id, tables)
+            key = repr((view.__name__, profile_id, versions, sorted(request.args.items())))
+            etag = hashlib.sha1(key.encode()).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+# Opaque keyset cursors: the (date, id) of the last row on the previous page
+def encode_cursor(row_date, row_id):
+    return base64.urlsafe_b64encode(json.dumps([row_date, row_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        row_date, row_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(row_date, str) or not isinstance(row_id, int):
+        raise ValueError('Invalid cursor')
+    return row_date, row_id
+
+def page_args():
+    limit = request.args.get('limit', app.config['PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+    after = request.args.get('after')
+    return limit, decode_cursor(after) if after else None
+
+def keyset_query(query, params, after):
+    # query selects from a per-profile table and ends with its WHERE clause; rows
+    # come back newest first, starting after the cursor's (date, id) if given.
+    if after:
+        query += ' AND (date, id) < (?, ?)'
+        params = (*params, *after)
+    return query + ' ORDER BY date DESC, id DESC', params
+
+def fetch_page(c, query, params, limit, after):
+    query, params = keyset_query(query, params, after)
+    c.execute(query + ' LIMIT ?', (*params, limit + 1))
+    rows = c.fetchall()
+    return rows[:limit], len(rows) > limit
+
+def stream_json(c, to_json, chunk_rows=500):
+    # Serializes the executed cursor as a JSON array, chunk_rows rows at a time, so
+    # memory stays flat however many rows match. The request context (and with it
+    # the pooled connection) lives until the last chunk has been sent.
+    def generate():
+        yield '['
+        separator = ''
+        while True:
+            rows = c.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield separator + ','.join(json.dumps(to_json(row)) for row in rows)
+            separator = ','
+        yield ']'
+    return app.response_class(stream_with_context(generate()), mimetype='application/json')
+
+# Expense rows with their category and payment method names joined back, in the
+# column order expense_json() reads. Filters and keyset cursors apply to it as to a
+# table; SQLite flattens it, so the expenses indexes still drive the query.
+EXPENSE_ROWS = '''(SELECT e.id, e.profile_id, e.amount, e.description, pm.name AS payment_method,
+                          cat.name AS category, e.date, e.category_id, e.payment_method_id
+                   FROM expenses e
+                   LEFT JOIN payment_methods pm ON pm.id = e.payment_method_id
+                   LEFT JOIN categories cat ON cat.id = e.category_id)'''
+
+def expense_json(row):
+    return {'id': row[0], 'amount': row[2], 'description': row[3],
+            'paymentMethod': row[4], 'category': row[5], 'date': row[6]}
+
+def income_json(row):
+    return {'id': row[0], 'amount': row[2], 'source': row[3], 'type': row[4], 'date': row[5]}
+
+def statement_json(row):
+    return {'id': row[0], 'card_name': row[2], 'amount': row[3],
+            'merchant': row[4], 'category': row[5], 'date': row[6]}
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+# /api/expenses filters: query arg -> (SQL predicate, value parser). ?1 is the profile
+# id, always the first parameter, so a name resolves to its id once per query.
+EXPENSE_FILTERS = {
+    'category': ('category_id = (SELECT id FROM categories WHERE profile_id = ?1 AND name = ?)', str),
+    'payment_method': ('payment_method_id = (SELECT id FROM payment_methods WHERE profile_id = ?1 AND name = ?)', str),
+    'start': ('date >= ?', lambda v: date.fromisoformat(v).isoformat()),
+    'end': ('date <= ?', lambda v: date.fromisoformat(v).isoformat()),
+    'min_amount': ('amount >= ?', float),
+    'max_amount': ('amount <= ?', float),
+    'q': ("description LIKE ? ESCAPE '\\'", lambda v: '%' + escape_like(v) + '%'),
+}
+
+def expense_filter_sql(profile_id, args):
+    # Compiles the supported filters into a parameterized WHERE clause. Every
+    # combination is served by an index; `flask check-query-plans` verifies it.
+    clauses = ['profile_id = ?']
+    params = [profile_id]
+    for name, (clause, parse) in EXPENSE_FILTERS.items():
+        value = args.get(name)
+        if value in (None, ''):
+            continue
+        try:
+            params.append(parse(value))
+        except ValueError:
+            raise ValueError(f'Invalid value for {name}: {value!r}')
+        clauses.append(clause)
+    return ' AND '.join(clauses), tuple(params)
+
+def parse_amount(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value <= 0:
+        raise ValueError('must be a positive number')
+    return float(value)
+
+def parse_text(value):
+    if not isinstance(value, str):
+        raise ValueError('must be a string')
+    return value
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(parse_text(value)).isoformat()
+    except ValueError:
+        raise ValueError('must be a YYYY-MM-DD date')
+
+# JSON record fields in column order: key -> (parser, default); None marks a required field
+EXPENSE_FIELDS = {
+    'amount': (parse_amount, None),
+    'description': (parse_text, ''),
+    'paymentMethod': (parse_text, None),
+    'category': (parse_text, ''),
+    'date': (parse_date, None),
+}
+INCOME_FIELDS = {
+    'amount': (parse_amount, None),
+    'source': (parse_text, ''),
+    'type': (parse_text, None),
+    'date': (parse_date, None),
+}
+
+def validate_record(item, fields, stored=None):
+    # With stored (a row's current values in field order), keys absent from item keep
+    # the stored value as is; only the keys the client sent are parsed.
+    if not isinstance(item, dict):
+        raise ValueError('expected an object')
+    values = []
+    for i, (key, (parse, default)) in enumerate(fields.items()):
+        if stored is not None and key not in item:
+            values.append(stored[i])
+            continue
+        value = item.get(key)
+        if value is None:
+            if default is None:
+                raise ValueError(f'{key} is required')
+            values.append(default)
+            continue
+        try:
+            values.append(parse(value))
+        except ValueError as e:
+            raise ValueError(f'{key} {e}')
+    return tuple(values)
+
+EXPENSE_COLUMNS = ('amount', 'description', 'payment_method', 'category', 'date')
+EXPENSE_STORED_COLUMNS = ('amount', 'description', 'payment_method_id', 'category_id', 'date')
+INCOME_COLUMNS = ('amount', 'source', 'type', 'date')
+
+# Per-profile dimension tables, each with the INSERT for a name first seen on a row.
+# Such a category enters as deleted: rows may carry any category, while the picker
+# lists only the ones added through /api/categories.
+DIMENSIONS = {
+    'categories': 'INSERT INTO categories (profile_id, name, deleted) VALUES (?, ?, 1)',
+    'payment_methods': 'INSERT INTO payment_methods (profile_id, name) VALUES (?, ?)',
+}
+
+def dimension_ids(c, table, profile_id, names):
+    # name -> id for the given names, adding the missing ones; one query per call
+    names = {name for name in names if name is not None}
+    if not names:
+        return {}
+    c.execute(f'SELECT name, id FROM {table} WHERE profile_id = ? AND name IN (SELECT value FROM json_each(?))',
+              (profile_id, json.dumps(sorted(names))))
+    ids = dict(c.fetchall())
+    for name in sorted(names - ids.keys()):
+        c.execute(DIMENSIONS[table], (profile_id, name))
+        ids[name] = c.lastrowid
+    return ids
+
+def dimension_totals(c, table, profile_id, totals):
+    # Folds {id: total} from an integer-keyed aggregation into {name: total}
+    c.execute(f'SELECT id, name FROM {table} WHERE profile_id = ?', (profile_id,))
+    names = dict(c.fetchall())
+    by_name = defaultdict(float)
+    for dimension_id, total in totals.items():
+        by_name[names.get(dimension_id, '')] += total
+    return dict(by_name)
+
+def encode_expenses(c, profile_id, records):
+    # EXPENSE_COLUMNS tuples -> EXPENSE_STORED_COLUMNS tuples
+    methods = dimension_ids(c, 'payment_methods', profile_id, [record[2] for record in records])
+    categories = dimension_ids(c, 'categories', profile_id, [record[3] for record in records])
+    return [(amount, description, methods.get(method), categories.get(category), day)
+            for amount, description, method, category, day in records]
+
+def rollup_deltas(rows, columns, key_columns, sign=1):
+    # Folds rows (tuples in `columns` order) into aggregated rollup deltas
+    # (key..., count, total), one per distinct rollup key
+    amount_i = columns.index('amount')
+    key_i = [columns.index(column) for column in key_columns]
+    deltas = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        delta = deltas[tuple(row[i] for i in key_i)]
+        delta[0] += sign
+        delta[1] += sign * row[amount_i]
+    return [(*key, n, total) for key, (n, total) in deltas.items() if n or total]
+
+def next_id(c, table):
+    # Under a write transaction, AUTOINCREMENT hands out consecutive ids from here
+    c.execute('SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = ?), 0) + 1', (table,))
+    return c.fetchone()[0]
+
+def insert_expenses(c, profile_id, records):
+    # records: validated tuples in EXPENSE_COLUMNS order; a blank category is filled
+    # in by the profile's rules. Must run inside BEGIN IMMEDIATE; returns the id of
+    # the first inserted row.
+    if any(not record[3] for record in records):
+        matcher = rule_matcher(c, profile_id)
+        records = [record if record[3] else
+                   (*record[:3], matcher.match(record[1]) or 'Miscellaneous', record[4]) for record in records]
+    stored = encode_expenses(c, profile_id, records)
+    first = next_id(c, 'expenses')
+    stamp = datetime.now().isoformat()
+    c.executemany('''INSERT INTO expenses (profile_id, amount, description, payment_method_id, category_id, date, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''', [(profile_id, *record, stamp) for record in stored])
+    update_expense_rollup(c, profile_id,
+                          rollup_deltas(stored, EXPENSE_STORED_COLUMNS, ('date', 'category_id', 'payment_method_id')))
+    bump_data_version(c, profile_id, 'expenses')
+    return first
+
+def insert_income(c, profile_id, records):
+    # records: validated tuples in INCOME_COLUMNS order; as insert_expenses()
+    first = next_id(c, 'income')
+    stamp = datetime.now().isoformat()
+    c.executemany('''INSERT INTO income (profile_id, amount, source, type, date, timestamp)
+                     VALUES (?, ?, ?, ?, ?, ?)''', [(profile_id, *record, stamp) for record in records])
+    update_income_rollup(c, profile_id, rollup_deltas(records, INCOME_COLUMNS, ('date', 'type')))
+    bump_data_version(c, profile_id, 'income')
+    return first
+
+# Editable transaction tables: JSON fields, their columns in the row source, the
+# stored columns a record encodes to, the stored columns keying the daily rollup, the
+# rollup updater, the JSON row shape, the row source and the record encoder
+TRANSACTION_TABLES = {
+    'expenses': (EXPENSE_FIELDS, EXPENSE_COLUMNS, EXPENSE_STORED_COLUMNS, ('date', 'category_id', 'payment_method_id'),
+                 update_expense_rollup, expense_json, EXPENSE_ROWS, encode_expenses),
+    'income': (INCOME_FIELDS, INCOME_COLUMNS, INCOME_COLUMNS, ('date', 'type'),
+               update_income_rollup, income_json, 'income', lambda c, profile_id, records: records),
+}
+
+# Merchant/description categorization rules. Each profile's rules compile into one
+# RuleMatcher, cached per process and rebuilt only when the profile's category_rules
+# version moves.
+RULE_KINDS = ('exact', 'prefix', 'keyword', 'regex')
+UNCATEGORIZED = ('', 'Miscellaneous')
+
+class RuleMatcher:
+    # exact: dict on the normalized text. prefix: character trie walked once.
+    # keyword: Aho-Corasick automaton over ' keyword ' so every keyword is found on
+    # word boundaries in a single pass. regex: tried in rank order, stopping once no
+    # remaining regex could outrank the best match. When several rules match, the
+    # highest (priority, kind specificity, pattern length, -id) wins.
+
+    def __init__(self, rules):
+        self.rules = len(rules)
+        self.exact = {}
+        self.trie = {}
+        self.goto = [{}]
+        self.best = [None]
+        regexes = []
+        for rule_id, kind, pattern, category, priority in rules:
+            rank = (priority, len(RULE_KINDS) - RULE_KINDS.index(kind), len(pattern), -rule_id)
+            candidate = (rank, category, rule_id)
+            if kind == 'regex':
+                regexes.append((candidate, re.compile(pattern, re.IGNORECASE)))
+                continue
+            text = normalize_merchant(pattern)
+            if kind == 'exact':
+                self.exact[text] = max(self.exact.get(text, candidate), candidate)
+            elif kind == 'prefix':
+                node = self.trie
+                for ch in text:
+                    node = node.setdefault(ch, {})
+                node[None] = max(node.get(None, candidate), candidate)
+            else:
+                self._add_keyword(f' {text} ', candidate)
+        self._link_keywords()
+        self.regexes = sorted(regexes, key=lambda item: item[0], reverse=True)
+        # One alternation rejects most texts before any single regex is tried; skipped
+        # when a pattern has backreferences, whose group numbers would shift
+        self.any_regex = None
+        patterns = [regex.pattern for _, regex in self.regexes]
+        if patterns and not any(re.search(r'\\[1-9]|\(\?P=', pattern) for pattern in patterns):
+            try:
+                self.any_regex = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.IGNORECASE)
+            except re.error:
+                pass
+
+    def _add_keyword(self, word, candidate):
+        state = 0
+        for ch in word:
+            nxt = self.goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][ch] = nxt
+                self.goto.append({})
+                self.best.append(None)
+            state = nxt
+        current = self.best[state]
+        self.best[state] = candidate if current is None else max(current, candidate)
+
+    def _link_keywords(self):
+        # Breadth-first failure links; each state's best also covers the keywords that
+        # end at its failure state, so matching reads one value per character
+        self.fail = [0] * len(self.goto)
+        pending = list(self.goto[0].values())
+        for state in pending:
+            for ch, nxt in self.goto[state].items():
+                pending.append(nxt)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(ch, 0)
+                inherited = self.best[self.fail[nxt]]
+                if inherited is not None and (self.best[nxt] is None or inherited > self.best[nxt]):
+                    self.best[nxt] = inherited
+
+    def lookup(self, text):
+        # Returns the winning (rank, category, rule_id), or None
+        norm = normalize_merchant(text)
+        best = self.exact.get(norm)
+
+        node = self.trie
+        for ch in norm:
+            node = node.get(ch)
+            if node is None:
+                break
+            found = node.get(None)
+            if found is not None and (best is None or found > best):
+                best = found
+
+        if len(self.goto) > 1:
+            goto, fail, outputs = self.goto, self.fail, self.best
+            state = 0
+            for ch in f' {norm} ':
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                found = outputs[state]
+                if found is not None and (best is None or found > best):
+                    best = found
+
+        if self.any_regex is not None and not self.any_regex.search(text):
+            return best
+        for candidate, regex in self.regexes:
+            if best is not None and best >= candidate:
+                break
+            if regex.search(text):
+                best = candidate
+                break
+        return best
+
+    def match(self, text):
+        found = self.lookup(text or '')
+        return found[1] if found else None
+
+    def categorize(self, rows):
+        # Staged statement rows (date, merchant, amount, category, fingerprint)
+        for row in rows:
+            if row[3] in UNCATEGORIZED:
+                category = self.match(row[1])
+                if category:
+                    row = (row[0], row[1], row[2], category, row[4])
+            yield row
+
+rule_matchers = {}
+
+def rule_matcher(c, profile_id):
+    version = table_versions(c, profile_id, ('category_rules',))[0]
+    cached = rule_matchers.get(profile_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    c.execute('SELECT id, kind, pattern, category, priority FROM category_rules WHERE profile_id = ?', (profile_id,))
+    matcher = RuleMatcher(c.fetchall())
+    rule_matchers[profile_id] = (version, matcher)
+    return matcher
+
+class ResultCache:
+    # In-process LRU of serialized JSON responses, bounded by total payload bytes
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._stats['evictions'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        stats['max_bytes'] = self.max_bytes
+        return stats
+
+result_cache = ResultCache(app.config['RESULT_CACHE_MAX_BYTES'])
+
+def cached_result(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        profile_id = get_profile_id()
+        # Relative periods ('monthly', 'daily', ...) move with the calendar, so the
+        # current date is part of the key alongside the query arguments.
+        key = (view.__name__, profile_id, date.today().isoformat(),
+               tuple(sorted(request.args.items())), data_version(get_db().cursor(), profile_id))
+        data = result_cache.get(key)
+        if data is not None:
+            response = app.response_class(data, mimetype='application/json')
+            response.headers['X-Cache'] = 'HIT'
+            return response
+
+        response = app.make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            result_cache.put(key, response.get_data())
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
+
 # HTML Template with modern dark mobile UI
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -1187,6 +2355,7 @@ HTML_TEMPLATE = '''
             <div class="transaction-list" id="allTransactions">
                 <!-- Dynamic content -->
             </div>
+            <button class="submit-btn" id="loadMoreTransactions" onclick="loadAllTransactions(true)" style="display: none; margin-top: 16px;">Load More</button>
         </div>
         
         <!-- Analytics/Charts Section -->
@@ -1256,8 +2425,12 @@ HTML_TEMPLATE = '''
             
             <div class="settings-card">
                 <h3 class="settings-title">Credit Card Statements</h3>
+                <div class="form-group">
+                    <label class="form-label">Card</label>
+                    <input type="text" class="form-input" id="statementCard" placeholder="e.g., HDFC Regalia (optional)">
+                </div>
                 <div class="upload-area" onclick="document.getElementById('statementFile').click()">
-                    <input type="file" id="statementFile" accept=".csv" onchange="uploadStatement()">
+                    <input type="file" id="statementFile" accept=".csv" multiple onchange="uploadStatement()">
                     <div class="upload-icon">📄</div>
                     <div class="upload-text">Click to upload CSV</div>
                     <div class="upload-hint">Format: Date, Merchant, Amount, Category</div>
@@ -1378,7 +2551,7 @@ HTML_TEMPLATE = '''
                 </div>
                 <div class="form-group">
                     <label class="form-label">Category</label>
-                    <select class="form-input" id="category" required></select>
+                    <select class="form-input" id="category"></select>
                 </div>
                 <div class="form-group">
                     <label class="form-label">Date</label>
@@ -1417,8 +2590,31 @@ HTML_TEMPLATE = '''
         let currentPeriod = 'monthly';
         let analyticsPeriod = 'monthly';
         let charts = {};
+        // GET endpoints send ETags; always revalidate so unchanged lists come back as 304
+        const revalidate = { cache: 'no-cache' };
         let customStartDate = '';
         let customEndDate = '';
+        let transactionsCursor = null;
+
+        function localISODate(d) {
+            return `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
+        }
+
+        function transactionFilters() {
+            const params = new URLSearchParams({ limit: 50 });
+            const today = new Date();
+            if (currentPeriod === 'daily') {
+                params.set('start', localISODate(today));
+            } else if (currentPeriod === 'monthly') {
+                params.set('start', localISODate(new Date(today.getFullYear(), today.getMonth(), 1)));
+            } else if (currentPeriod === 'yearly') {
+                params.set('start', localISODate(new Date(today.getFullYear(), 0, 1)));
+            } else if (currentPeriod === 'custom' && customStartDate && customEndDate) {
+                params.set('start', customStartDate);
+                params.set('end', customEndDate);
+            }
+            return params;
+        }
         
         const categoryIcons = {
             'Food': '🍔',
@@ -1570,11 +2766,11 @@ HTML_TEMPLATE = '''
         }
 
         async function loadCategories() {
-            const response = await fetch('/api/categories');
+            const response = await fetch('/api/categories', revalidate);
             const categories = await response.json();
             
             const select = document.getElementById('category');
-            select.innerHTML = '<option value="">Select category...</option>';
+            select.innerHTML = '<option value="">Auto (category rules)</option>';
             
             categories.forEach(cat => {
                 const option = document.createElement('option');
@@ -1654,7 +2850,7 @@ HTML_TEMPLATE = '''
         }
 
         async function updateBudgetStatus(categorySpending) {
-            const budgetsResp = await fetch('/api/budgets');
+            const budgetsResp = await fetch('/api/budgets', revalidate);
             const budgets = await budgetsResp.json();
             
             const statusContainer = document.getElementById('budgetStatus');
@@ -1691,13 +2887,13 @@ HTML_TEMPLATE = '''
         }
 
         async function loadRecentTransactions() {
-            const response = await fetch('/api/expenses');
+            const response = await fetch('/api/expenses?limit=5', revalidate);
             const expenses = await response.json();
             
             const container = document.getElementById('recentTransactions');
             container.innerHTML = '';
             
-            expenses.slice(0, 5).forEach(exp => {
+            expenses.forEach(exp => {
                 const iconClass = exp.category.toLowerCase().replace(/\\s+/g, '');
                 container.innerHTML += `
                     <div class="transaction-item">
@@ -1714,13 +2910,16 @@ HTML_TEMPLATE = '''
             });
         }
 
-        async function loadAllTransactions() {
-            let url = `/api/expenses`;
-            const response = await fetch(url);
+        async function loadAllTransactions(append = false) {
+            const params = transactionFilters();
+            if (append && transactionsCursor) params.set('after', transactionsCursor);
+            const response = await fetch(`/api/expenses?${params}`, revalidate);
             const expenses = await response.json();
+            transactionsCursor = response.headers.get('X-Next-Cursor');
+            document.getElementById('loadMoreTransactions').style.display = transactionsCursor ? 'block' : 'none';
             
             const container = document.getElementById('allTransactions');
-            container.innerHTML = '';
+            if (!append) container.innerHTML = '';
             
             expenses.forEach(exp => {
                 const iconClass = exp.category.toLowerCase().replace(/\\s+/g, '');
@@ -1791,13 +2990,13 @@ HTML_TEMPLATE = '''
         });
 
         async function loadIncome() {
-            const response = await fetch('/api/income');
+            const response = await fetch('/api/income?limit=10', revalidate);
             const incomes = await response.json();
             
             const container = document.getElementById('incomeList');
             container.innerHTML = '';
             
-            incomes.slice(0, 10).forEach(inc => {
+            incomes.forEach(inc => {
                 container.innerHTML += `
                     <div class="transaction-item">
                         <div class="transaction-icon income">💰</div>
@@ -1962,14 +3161,14 @@ HTML_TEMPLATE = '''
         }
 
         async function loadBudgets() {
-            const response = await fetch('/api/budgets');
+            const response = await fetch('/api/budgets', revalidate);
             const budgets = await response.json();
             document.getElementById('monthlyBudget').value = budgets.monthly || '';
 
             const container = document.getElementById('categoryBudgets');
             container.innerHTML = '';
 
-            const cats = await fetch('/api/categories').then(r => r.json());
+            const cats = await fetch('/api/categories', revalidate).then(r => r.json());
             cats.forEach(cat => {
                 const val = budgets.categories && budgets.categories[cat.name] || '';
                 container.innerHTML += `
@@ -2025,7 +3224,7 @@ HTML_TEMPLATE = '''
         }
 
         async function saveCategoryBudgets() {
-            const cats = await fetch('/api/categories').then(r => r.json());
+            const cats = await fetch('/api/categories', revalidate).then(r => r.json());
             const budgets = {};
             cats.forEach(cat => {
                 const input = document.getElementById(`budget-${cat.name}`);
@@ -2045,28 +3244,57 @@ HTML_TEMPLATE = '''
         }
 
         async function uploadStatement() {
-            const file = document.getElementById('statementFile').files[0];
-            if (!file) return;
+            const input = document.getElementById('statementFile');
+            if (!input.files.length) return;
 
             const formData = new FormData();
-            formData.append('file', file);
+            for (const file of input.files) {
+                formData.append('file', file);
+            }
+            formData.append('card', document.getElementById('statementCard').value.trim());
+            input.value = '';
 
-            const response = await fetch('/api/credit/upload', {
+            const response = await fetch('/api/credit/upload/batch', {
                 method: 'POST',
                 body: formData
             });
 
-            if (response.ok) {
-                showToast('Statement uploaded!');
+            if (!response.ok) {
+                showToast('Error uploading statement', true);
+                return;
+            }
+
+            const { jobs } = await response.json();
+            showToast(jobs.length === 1 ? 'Statement queued for import' : `${jobs.length} statements queued for import`);
+            jobs.forEach(job => pollImportJob(job.job_id));
+        }
+
+        async function pollImportJob(jobId) {
+            const response = await fetch(`/api/imports/${jobId}`, { cache: 'no-store' });
+            if (!response.ok) {
+                showToast('Lost track of statement import', true);
+                return;
+            }
+            const job = await response.json();
+
+            if (job.status === 'queued' || job.status === 'running') {
+                setTimeout(() => pollImportJob(jobId), 1000);
+            } else if (job.status === 'completed') {
+                const duplicates = job.report.skipped_duplicates;
+                const skipped = (duplicates ? `, ${duplicates} already imported` : '') +
+                    (job.rows_rejected ? `, ${job.rows_rejected} rejected` : '');
+                showToast(`Imported ${job.rows_processed} transactions${skipped}`);
                 loadCreditData();
                 updateDashboard();
+            } else if (job.status === 'cancelled') {
+                showToast('Statement import cancelled', true);
             } else {
-                showToast('Error uploading statement', true);
+                showToast(`Statement import failed: ${job.error}`, true);
             }
         }
 
         async function loadCreditData() {
-            const response = await fetch('/api/credit/statements');
+            const response = await fetch('/api/credit/statements', revalidate);
             const statements = await response.json();
             
             const container = document.getElementById('creditList');
@@ -2105,7 +3333,7 @@ HTML_TEMPLATE = '''
         }
 
         async function renderCategoryList() {
-            const response = await fetch('/api/categories');
+            const response = await fetch('/api/categories', revalidate);
             const categories = await response.json();
             const container = document.getElementById('categoryList');
             container.innerHTML = '';
@@ -2143,7 +3371,7 @@ def index():
 
 @app.route('/api/profiles')
 def get_profiles():
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute('SELECT id, name, theme FROM profiles')
     profiles = []
@@ -2155,7 +3383,6 @@ def get_profiles():
             'theme': row[2],
             'is_current': row[0] == current_profile_id
         })
-    conn.close()
     return jsonify(profiles)
 
 @app.route('/api/profile/switch', methods=['POST'])
@@ -2168,116 +3395,503 @@ def switch_profile():
 def update_profile():
     name = request.json['name']
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute('UPDATE profiles SET name = ? WHERE id = ?', (name, profile_id))
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 @app.route('/api/profile/theme', methods=['POST'])
 def update_theme():
     theme = request.json['theme']
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute('UPDATE profiles SET theme = ? WHERE id = ?', (theme, profile_id))
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 @app.route('/api/categories', methods=['GET', 'POST'])
+@conditional_get('categories')
 def categories():
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'POST':
         name = request.json['name']
-        try:
-            c.execute('INSERT INTO categories (profile_id, name) VALUES (?, ?)', (profile_id, name))
-            conn.commit()
-            conn.close()
-            return jsonify({'success': True})
-        except sqlite3.IntegrityError:
-            conn.close()
+        # Adding a deleted (or so far only used) name brings it back with its id
+        c.execute('''INSERT INTO categories (profile_id, name) VALUES (?, ?)
+                     ON CONFLICT (profile_id, name) DO UPDATE SET deleted = 0 WHERE deleted''', (profile_id, name))
+        if c.rowcount == 0:
+            conn.rollback()
             return jsonify({'error': 'Category exists'}), 400
+        bump_data_version(c, profile_id, 'categories')
+        conn.commit()
+        return jsonify({'success': True})
 
-    c.execute('SELECT id, name FROM categories WHERE profile_id = ? ORDER BY name', (profile_id,))
+    c.execute('SELECT id, name FROM categories WHERE profile_id = ? AND NOT deleted ORDER BY name', (profile_id,))
     categories = [{'id': row[0], 'name': row[1]} for row in c.fetchall()]
-    conn.close()
     return jsonify(categories)
 
-@app.route('/api/categories/<name>', methods=['DELETE'])
-def delete_category(name):
+@app.route('/api/categories/<name>', methods=['PUT', 'DELETE'])
+def category_item(name):
+    # Expenses reference categories by id, so a delete only hides the name from the
+    # picker (rows keep showing it) and a rename is one row, however many rows use it
+    profile_id = get_profile_id()
+    conn = get_db()
+    c = conn.cursor()
+    if request.method == 'DELETE':
+        c.execute('UPDATE categories SET deleted = 1 WHERE profile_id = ? AND name = ?', (profile_id, name))
+        bump_data_version(c, profile_id, 'categories')
+        conn.commit()
+        return jsonify({'success': True})
+
+    body = request.get_json(silent=True)
+    new_name = body.get('name') if isinstance(body, dict) else None
+    if not isinstance(new_name, str) or not new_name.strip():
+        return jsonify({'error': 'name is required'}), 400
+    new_name = new_name.strip()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute('UPDATE categories SET name = ? WHERE profile_id = ? AND name = ?', (new_name, profile_id, name))
+        if c.rowcount == 0:
+            conn.rollback()
+            return jsonify({'error': 'Not found'}), 404
+        # Budgets and rules name their category; both are a handful of rows per profile
+        c.execute("UPDATE budgets SET category = ? WHERE profile_id = ? AND category = ? AND category != 'MONTHLY'",
+                  (new_name, profile_id, name))
+        c.execute('UPDATE category_rules SET category = ? WHERE profile_id = ? AND category = ?',
+                  (new_name, profile_id, name))
+        bump_data_version(c, profile_id, 'categories', 'expenses', 'budgets', 'category_rules')
+        conn.commit()
+    except sqlite3.IntegrityError:
+        conn.rollback()
+        return jsonify({'error': 'Category exists'}), 400
+    except Exception:
+        conn.rollback()
+        raise
+    return jsonify({'success': True})
+
+def rule_json(row):
+    return {'id': row[0], 'kind': row[1], 'pattern': row[2], 'category': row[3], 'priority': row[4]}
+
+def validate_rule(body):
+    if not isinstance(body, dict):
+        raise ValueError('Expected a JSON object')
+    kind = body.get('kind')
+    if kind not in RULE_KINDS:
+        raise ValueError(f'kind must be one of {", ".join(RULE_KINDS)}')
+    pattern = body.get('pattern')
+    if not isinstance(pattern, str) or not pattern.strip():
+        raise ValueError('pattern is required')
+    if kind == 'regex':
+        try:
+            re.compile(pattern)
+        except re.error as e:
+            raise ValueError(f'Invalid regex: {e}')
+    elif not normalize_merchant(pattern):
+        raise ValueError('pattern must contain letters or digits')
+    category = body.get('category')
+    if not isinstance(category, str) or not category.strip():
+        raise ValueError('category is required')
+    priority = body.get('priority', 0)
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        raise ValueError('priority must be an integer')
+    return kind, pattern, category.strip(), priority
+
+@app.route('/api/rules', methods=['GET', 'POST'])
+@conditional_get('category_rules')
+def category_rules():
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
-    c.execute('DELETE FROM categories WHERE profile_id = ? AND name = ?', (profile_id, name))
+
+    if request.method == 'POST':
+        try:
+            rule = validate_rule(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        c.execute('''INSERT INTO category_rules (profile_id, kind, pattern, category, priority, created_date)
+                     VALUES (?, ?, ?, ?, ?, ?)''', (profile_id, *rule, datetime.now().isoformat()))
+        rule_id = c.lastrowid
+        bump_data_version(c, profile_id, 'category_rules')
+        conn.commit()
+        return jsonify({'success': True, 'id': rule_id})
+
+    c.execute('''SELECT id, kind, pattern, category, priority FROM category_rules
+                 WHERE profile_id = ? ORDER BY priority DESC, id''', (profile_id,))
+    return jsonify([rule_json(row) for row in c.fetchall()])
+
+@app.route('/api/rules/<int:rule_id>', methods=['PUT', 'DELETE'])
+def category_rule(rule_id):
+    profile_id = get_profile_id()
+    conn = get_db()
+    c = conn.cursor()
+
+    if request.method == 'PUT':
+        try:
+            rule = validate_rule(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        c.execute('''UPDATE category_rules SET kind = ?, pattern = ?, category = ?, priority = ?
+                     WHERE id = ? AND profile_id = ?''', (*rule, rule_id, profile_id))
+    else:
+        c.execute('DELETE FROM category_rules WHERE id = ? AND profile_id = ?', (rule_id, profile_id))
+    if c.rowcount == 0:
+        conn.rollback()
+        return jsonify({'error': 'Not found'}), 404
+    bump_data_version(c, profile_id, 'category_rules')
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
+@app.route('/api/rules/match', methods=['POST'])
+def match_category_rules():
+    # Which rule, if any, would categorize this merchant or description
+    body = request.get_json(silent=True)
+    text = body.get('text') if isinstance(body, dict) else None
+    if not isinstance(text, str):
+        return jsonify({'error': 'text is required'}), 400
+    found = rule_matcher(get_db().cursor(), get_profile_id()).lookup(text)
+    if found is None:
+        return jsonify({'category': None, 'rule_id': None})
+    return jsonify({'category': found[1], 'rule_id': found[2]})
+
 @app.route('/api/expenses', methods=['GET', 'POST'])
+@conditional_get('expenses')
 def expenses():
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'POST':
-        exp = request.json
-        c.execute('''INSERT INTO expenses (profile_id, amount, description, payment_method, category, date, timestamp)
-                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                  (profile_id, exp['amount'], exp['description'], exp['paymentMethod'],
-                   exp['category'], exp['date'], datetime.now().isoformat()))
+        try:
+            record = validate_record(request.get_json(silent=True), EXPENSE_FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        c.execute('BEGIN IMMEDIATE')
+        expense_id = insert_expenses(c, profile_id, [record])
         conn.commit()
-        conn.close()
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'id': expense_id})
 
-    c.execute('SELECT * FROM expenses WHERE profile_id = ? ORDER BY date DESC', (profile_id,))
-    expenses = []
-    for row in c.fetchall():
-        expenses.append({
-            'id': row[0], 'amount': row[2], 'description': row[3],
-            'paymentMethod': row[4], 'category': row[5], 'date': row[6]
-        })
-    conn.close()
-    return jsonify(expenses)
+    try:
+        limit, after = page_args()
+        where, params = expense_filter_sql(profile_id, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('stream') == '1':
+        c.execute(*keyset_query(f'SELECT * FROM {EXPENSE_ROWS} WHERE {where}', params, after))
+        return stream_json(c, expense_json)
+
+    rows, has_more = fetch_page(c, f'SELECT * FROM {EXPENSE_ROWS} WHERE {where}', params, limit, after)
+    response = jsonify([expense_json(row) for row in rows])
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor(rows[-1][6], rows[-1][0])
+    return response
 
 @app.route('/api/income', methods=['GET', 'POST'])
+@conditional_get('income')
 def income():
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     if request.method == 'POST':
-        inc = request.json
-        c.execute('''INSERT INTO income (profile_id, amount, source, type, date, timestamp)
-                     VALUES (?, ?, ?, ?, ?, ?)''',
-                  (profile_id, inc['amount'], inc['source'], inc['type'],
-                   inc['date'], datetime.now().isoformat()))
+        try:
+            record = validate_record(request.get_json(silent=True), INCOME_FIELDS)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        c.execute('BEGIN IMMEDIATE')
+        income_id = insert_income(c, profile_id, [record])
         conn.commit()
-        conn.close()
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'id': income_id})
+
+    try:
+        limit, after = page_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if request.args.get('stream') == '1':
+        c.execute(*keyset_query('SELECT * FROM income WHERE profile_id = ?', (profile_id,), after))
+        return stream_json(c, income_json)
+
+    rows, has_more = fetch_page(c, 'SELECT * FROM income WHERE profile_id = ?', (profile_id,), limit, after)
+    response = jsonify([income_json(row) for row in rows])
+    if has_more:
+        response.headers['X-Next-Cursor'] = encode_cursor(rows[-1][5], rows[-1][0])
+    return response
+
+def create_batch(fields, insert):
+    # Validates every record before touching the database, then inserts the valid ones
+    # with one executemany in one transaction. Any invalid record rejects the whole
+    # batch unless ?partial=1, which inserts the rest and reports the failures.
+    profile_id = get_profile_id()
+    items = request.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Expected a non-empty JSON array of records'}), 400
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f'At most {app.config["BATCH_MAX_ITEMS"]} records per batch'}), 413
+
+    results, records = [], []
+    for index, item in enumerate(items):
+        try:
+            records.append(validate_record(item, fields))
+            results.append({'index': index, 'status': 'created'})
+        except ValueError as e:
+            results.append({'index': index, 'status': 'invalid', 'error': str(e)})
+    errors = len(items) - len(records)
+    if errors and request.args.get('partial') != '1':
+        for result in results:
+            if result['status'] == 'created':
+                result['status'] = 'skipped'
+        return jsonify({'success': False, 'inserted': 0, 'errors': errors, 'results': results}), 400
+
+    if records:
+        conn = get_db()
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            first = insert(c, profile_id, records)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        ids = iter(range(first, first + len(records)))
+        for result in results:
+            if result['status'] == 'created':
+                result['id'] = next(ids)
+    return jsonify({'success': True, 'inserted': len(records), 'errors': errors, 'results': results})
+
+@app.route('/api/expenses/batch', methods=['POST'])
+def create_expenses_batch():
+    return create_batch(EXPENSE_FIELDS, insert_expenses)
+
+@app.route('/api/income/batch', methods=['POST'])
+def create_income_batch():
+    return create_batch(INCOME_FIELDS, insert_income)
+
+def update_transaction(table, row_id):
+    # Fields missing from the body keep their stored values, unvalidated: a legacy row
+    # the parsers would reject can still be edited. The rollup moves by the
+    # old row's negative delta and the new row's positive one, never a recompute.
+    fields, columns, stored_columns, key_columns, update_rollup, to_json, rows, encode = TRANSACTION_TABLES[table]
+    profile_id = get_profile_id()
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute(f'SELECT {", ".join(columns + stored_columns)} FROM {rows} WHERE id = ? AND profile_id = ?',
+                  (row_id, profile_id))
+        row = c.fetchone()
+        if row is None:
+            conn.rollback()
+            return jsonify({'error': 'Not found'}), 404
+        old, old_stored = row[:len(columns)], row[len(columns):]
+        try:
+            new = validate_record(body, fields, old)
+        except ValueError as e:
+            conn.rollback()
+            return jsonify({'error': str(e)}), 400
+        new_stored = encode(c, profile_id, [new])[0]
+        c.execute(f'UPDATE {table} SET {", ".join(f"{column} = ?" for column in stored_columns)} WHERE id = ?',
+                  (*new_stored, row_id))
+        update_rollup(c, profile_id, rollup_deltas([old_stored], stored_columns, key_columns, -1) +
+                      rollup_deltas([new_stored], stored_columns, key_columns))
+        bump_data_version(c, profile_id, table)
+        c.execute(f'SELECT * FROM {rows} WHERE id = ?', (row_id,))
+        row = c.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return jsonify(to_json(row))
+
+def delete_transactions(table, ids):
+    # Returns the ids actually deleted; the rollup shrinks by their aggregated deltas
+    fields, columns, stored_columns, key_columns, update_rollup, to_json, rows, encode = TRANSACTION_TABLES[table]
+    profile_id = get_profile_id()
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute(f'''DELETE FROM {table} WHERE profile_id = ? AND id IN (SELECT value FROM json_each(?))
+                      RETURNING id, {", ".join(stored_columns)}''', (profile_id, json.dumps(ids)))
+        deleted = c.fetchall()
+        if deleted:
+            update_rollup(c, profile_id, rollup_deltas([row[1:] for row in deleted], stored_columns, key_columns, -1))
+            bump_data_version(c, profile_id, table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return [row[0] for row in deleted]
+
+def bulk_delete(table):
+    body = request.get_json(silent=True)
+    ids = body.get('ids') if isinstance(body, dict) else body
+    if (not isinstance(ids, list) or not ids
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids)):
+        return jsonify({'error': 'Expected {"ids": [...]} with integer ids'}), 400
+    if len(ids) > app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f'At most {app.config["BATCH_MAX_ITEMS"]} ids per request'}), 413
+    deleted = delete_transactions(table, ids)
+    found = set(deleted)
+    return jsonify({'success': True, 'deleted': len(deleted),
+                    'not_found': [i for i in dict.fromkeys(ids) if i not in found]})
+
+@app.route('/api/expenses/<int:expense_id>', methods=['PUT', 'DELETE'])
+def expense_item(expense_id):
+    if request.method == 'PUT':
+        return update_transaction('expenses', expense_id)
+    if not delete_transactions('expenses', [expense_id]):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'success': True})
 
-    c.execute('SELECT * FROM income WHERE profile_id = ? ORDER BY date DESC', (profile_id,))
-    incomes = []
-    for row in c.fetchall():
-        incomes.append({
-            'id': row[0], 'amount': row[2], 'source': row[3],
-            'type': row[4], 'date': row[5]
-        })
-    conn.close()
-    return jsonify(incomes)
+@app.route('/api/income/<int:income_id>', methods=['PUT', 'DELETE'])
+def income_item(income_id):
+    if request.method == 'PUT':
+        return update_transaction('income', income_id)
+    if not delete_transactions('income', [income_id]):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/expenses/batch', methods=['DELETE'])
+def delete_expenses_batch():
+    return bulk_delete('expenses')
+
+@app.route('/api/income/batch', methods=['DELETE'])
+def delete_income_batch():
+    return bulk_delete('income')
+
+# Text match modes for bulk recategorization: mode -> (SQL predicate on {column}, value)
+RECATEGORIZE_MODES = {
+    'contains': ("{column} LIKE ? ESCAPE '\\'", lambda v: '%' + escape_like(v) + '%'),
+    'prefix': ("{column} LIKE ? ESCAPE '\\'", lambda v: escape_like(v) + '%'),
+    'exact': ('{column} = ? COLLATE NOCASE', str),
+    'regex': ('{column} REGEXP ?', str),
+}
+# Tables that can be recategorized, with the text column a pattern is matched against
+# and the column holding the category
+RECATEGORIZE_TABLES = {'expenses': ('description', 'category_id'), 'credit_statements': ('merchant', 'category')}
+
+def recategorize_filter(profile_id, body, table, category, old_category):
+    # category/old_category are the values stored in the table's category column
+    text_column, category_column = RECATEGORIZE_TABLES[table]
+    clauses = ['profile_id = ?', f'{category_column} IS NOT ?']
+    params = [profile_id, category]
+    if body.get('pattern'):
+        clause, parse = RECATEGORIZE_MODES[body.get('mode', 'contains')]
+        clauses.append(clause.format(column=text_column))
+        params.append(parse(body['pattern']))
+    if body.get('old_category') is not None:
+        clauses.append(f'{category_column} = ?')
+        params.append(old_category)
+    for name, clause in (('start', 'date >= ?'), ('end', 'date <= ?')):
+        if body.get(name):
+            clauses.append(clause)
+            params.append(date.fromisoformat(body[name]).isoformat())
+    return ' AND '.join(clauses), params
+
+def validate_recategorize(body):
+    if not isinstance(body, dict):
+        raise ValueError('Expected a JSON object')
+    if not isinstance(body.get('category'), str) or not body['category'].strip():
+        raise ValueError('category is required')
+    if not body.get('pattern') and body.get('old_category') is None:
+        raise ValueError('Give a pattern, an old_category, or both')
+    for name in ('pattern', 'old_category', 'start', 'end'):
+        if body.get(name) is not None and not isinstance(body[name], str):
+            raise ValueError(f'{name} must be a string')
+    mode = body.get('mode', 'contains')
+    if mode not in RECATEGORIZE_MODES:
+        raise ValueError(f'mode must be one of {", ".join(RECATEGORIZE_MODES)}')
+    if mode == 'regex' and body.get('pattern'):
+        try:
+            re.compile(body['pattern'])
+        except re.error as e:
+            raise ValueError(f'Invalid regex: {e}')
+    tables = body.get('tables', list(RECATEGORIZE_TABLES))
+    if not isinstance(tables, list) or not tables or any(t not in RECATEGORIZE_TABLES for t in tables):
+        raise ValueError(f'tables must be a list drawn from {", ".join(RECATEGORIZE_TABLES)}')
+    for name in ('start', 'end'):
+        if body.get(name):
+            try:
+                date.fromisoformat(body[name])
+            except ValueError:
+                raise ValueError(f'{name} must be a YYYY-MM-DD date')
+    return tables
+
+@app.route('/api/recategorize', methods=['POST'])
+def recategorize():
+    # Moves every matching row to a new category with one UPDATE per table, in one
+    # transaction. The expense rollup is patched from the moved rows' aggregate
+    # (one negative delta per old key, one positive per new key), not rebuilt.
+    profile_id = get_profile_id()
+    body = request.get_json(silent=True)
+    try:
+        tables = validate_recategorize(body)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    category = body['category'] = body['category'].strip()
+    dry_run = bool(body.get('dry_run'))
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        result = {'dry_run': dry_run}
+        for table in tables:
+            if table == 'expenses':
+                # Expenses store category ids; an unknown old_category matches no row
+                category_id = dimension_ids(c, 'categories', profile_id, [category])[category]
+                c.execute('SELECT id FROM categories WHERE profile_id = ? AND name = ?',
+                          (profile_id, body.get('old_category')))
+                old = c.fetchone()
+                where, params = recategorize_filter(profile_id, body, table, category_id, old and old[0])
+                c.execute(f'''SELECT date, category_id, payment_method_id, COUNT(*), SUM(amount) FROM expenses
+                              WHERE {where} GROUP BY date, category_id, payment_method_id''', params)
+                moved = c.fetchall()
+                result['expenses'] = sum(row[3] for row in moved)
+                result['rollup_keys'] = len(moved)
+                if dry_run or not moved:
+                    continue
+                c.execute(f'UPDATE expenses SET category_id = ? WHERE {where}', (category_id, *params))
+                update_expense_rollup(c, profile_id, [(d, cat, method, -n, -total) for d, cat, method, n, total in moved] +
+                                      [(d, category_id, method, n, total) for d, _, method, n, total in moved])
+            else:
+                where, params = recategorize_filter(profile_id, body, table, category, body.get('old_category'))
+                if dry_run:
+                    c.execute(f'SELECT COUNT(*) FROM {table} WHERE {where}', params)
+                    result[table] = c.fetchone()[0]
+                    continue
+                c.execute(f'UPDATE {table} SET category = ? WHERE {where}', (category, *params))
+                result[table] = c.rowcount
+            if result[table]:
+                bump_data_version(c, profile_id, table)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return jsonify({'success': True, **result})
 
 @app.route('/api/summary')
+@cached_result
 def summary():
     profile_id = get_profile_id()
     period = request.args.get('period', 'monthly')
     start_custom = request.args.get('start')
     end_custom = request.args.get('end')
 
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     today = date.today()
@@ -2293,24 +3907,20 @@ def summary():
     else:
         start_date = '1970-01-01'
 
-    c.execute('SELECT SUM(amount) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ?',
+    c.execute('''SELECT category_id, SUM(total) FROM expense_daily_rollup
+                 WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY category_id''',
               (profile_id, start_date, today.isoformat()))
-    total_expenses = c.fetchone()[0] or 0
+    by_category = dimension_totals(c, 'categories', profile_id, dict(c.fetchall()))
+    total_expenses = sum(by_category.values())
 
-    c.execute('SELECT SUM(amount) FROM income WHERE profile_id = ? AND date >= ? AND date <= ?',
+    c.execute('SELECT SUM(total) FROM income_daily_rollup WHERE profile_id = ? AND date >= ? AND date <= ?',
               (profile_id, start_date, today.isoformat()))
     total_income = c.fetchone()[0] or 0
 
-    c.execute('SELECT category, SUM(amount) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY category',
-              (profile_id, start_date, today.isoformat()))
-    by_category = {row[0]: row[1] for row in c.fetchall()}
-
     c.execute("SELECT amount FROM budgets WHERE profile_id = ? AND category = 'MONTHLY' AND period = 'monthly'", (profile_id,))
     result = c.fetchone()
     total_budget = result[0] if result else 0
 
-    conn.close()
-
     return jsonify({
         'total_expenses': total_expenses,
         'total_income': total_income,
@@ -2318,17 +3928,103 @@ def summary():
         'by_category': by_category
     })
 
+# SQL expressions mapping a rollup date onto the start of its trend bucket
+TREND_BUCKETS = {
+    'day': 'date',
+    'week': "date(date, '-6 days', 'weekday 1')",
+    'month': "strftime('%Y-%m', date)",
+}
+
+def aggregate_period(c, profile_id, start_date, end_date, resolution='day'):
+    # A single scan of each rollup slice yields every aggregate analytics() needs,
+    # instead of one query per total/grouping. Monthly totals are folded from the
+    # per-day totals rather than from every row, category and payment method totals
+    # are keyed by id and named once at the end.
+    count = 0
+    by_category = defaultdict(float)
+    by_payment = defaultdict(float)
+    by_date = defaultdict(float)
+    by_bucket = defaultdict(float)
+    c.execute(f'''SELECT date, {TREND_BUCKETS[resolution]}, category_id, payment_method_id, txn_count, total
+                  FROM expense_daily_rollup WHERE profile_id = ? AND date >= ? AND date <= ?''',
+              (profile_id, start_date, end_date))
+    for day, bucket, category_id, method_id, n, amount in c:
+        count += n
+        by_category[category_id] += amount
+        by_payment[method_id] += amount
+        by_date[day] += amount
+        by_bucket[bucket] += amount
+
+    expense_by_month = defaultdict(float)
+    for day, amount in by_date.items():
+        if day[4:5] == '-':
+            expense_by_month[day[:7]] += amount
+
+    income_by_month = defaultdict(float)
+    c.execute('''SELECT date, total FROM income_daily_rollup
+                 WHERE profile_id = ? AND date >= ? AND date <= ?''',
+              (profile_id, start_date, end_date))
+    for day, amount in c:
+        if day[4:5] == '-':
+            income_by_month[day[:7]] += amount
+
+    return {
+        'total_expenses': sum(by_date.values()),
+        'transaction_count': count,
+        'by_category': dimension_totals(c, 'categories', profile_id, by_category),
+        'by_payment': dimension_totals(c, 'payment_methods', profile_id, by_payment),
+        'by_date': dict(by_date),
+        'by_bucket': dict(by_bucket),
+        'expense_by_month': dict(expense_by_month),
+        'income_by_month': dict(income_by_month),
+    }
+
+def choose_resolution(start, end, max_points):
+    span = (end - start).days + 1
+    if span <= max_points:
+        return 'day'
+    if (span + 6) // 7 <= max_points:
+        return 'week'
+    return 'month'
+
+def trend_labels_for(start, end, resolution, max_points):
+    # Only the most recent max_points buckets are returned
+    if resolution == 'day':
+        current = max(start, end - timedelta(days=max_points - 1))
+    elif resolution == 'week':
+        current = max(start, end - timedelta(weeks=max_points - 1))
+        current -= timedelta(days=current.weekday())
+    else:
+        months = end.year * 12 + end.month - max_points
+        current = max(start.replace(day=1), date(months // 12, months % 12 + 1, 1))
+
+    labels = []
+    while current <= end:
+        if resolution == 'month':
+            labels.append(current.strftime('%Y-%m'))
+            current = (current.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            labels.append(current.isoformat())
+            current += timedelta(days=7 if resolution == 'week' else 1)
+    return labels[-max_points:]
+
 @app.route('/api/analytics')
+@cached_result
 def analytics():
     profile_id = get_profile_id()
     period = request.args.get('period', 'monthly')
     start_custom = request.args.get('start')
     end_custom = request.args.get('end')
+    resolution = request.args.get('resolution', 'auto')
+    max_points = app.config['ANALYTICS_MAX_POINTS']
+    if resolution != 'auto' and resolution not in TREND_BUCKETS:
+        return jsonify({'error': f'Invalid resolution, expected auto or one of {sorted(TREND_BUCKETS)}'}), 400
 
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     today = date.today()
+    trend_start = None
     if period == 'daily':
         start_date = today.isoformat()
         days = 1
@@ -2344,73 +4040,156 @@ def analytics():
         days = (today - date.fromisoformat(start_date)).days + 1
     else:
         start_date = '1970-01-01'
-        c.execute('SELECT MIN(date) FROM expenses WHERE profile_id = ?', (profile_id,))
+        c.execute('SELECT MIN(date) FROM expense_daily_rollup WHERE profile_id = ?', (profile_id,))
         first_date = c.fetchone()[0]
         days = (today - date.fromisoformat(first_date)).days + 1 if first_date else 1
+        # The lifetime trend starts at the first transaction, not at 1970
+        trend_start = date.fromisoformat(first_date) if first_date else today
 
-    c.execute('SELECT SUM(amount) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ?',
-              (profile_id, start_date, today.isoformat()))
-    total_expenses = c.fetchone()[0] or 0
+    # A bounded period's trend covers the whole period; only its bucket size adapts to the span
+    if trend_start is None:
+        trend_start = date.fromisoformat(start_date)
+    if resolution == 'auto':
+        resolution = choose_resolution(trend_start, today, max_points)
 
-    c.execute('SELECT COUNT(*) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ?',
-              (profile_id, start_date, today.isoformat()))
-    transaction_count = c.fetchone()[0]
-
-    c.execute('SELECT category, SUM(amount) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY category',
-              (profile_id, start_date, today.isoformat()))
-    by_category = {row[0]: row[1] for row in c.fetchall()}
+    agg = aggregate_period(c, profile_id, start_date, today.isoformat(), resolution)
+    by_category = agg['by_category']
     highest_category = max(by_category, key=by_category.get) if by_category else None
 
-    c.execute('SELECT payment_method, SUM(amount) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY payment_method',
-              (profile_id, start_date, today.isoformat()))
-    by_payment = {row[0]: row[1] for row in c.fetchall()}
-
-    c.execute('SELECT date, SUM(amount) FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY date ORDER BY date',
-              (profile_id, start_date, today.isoformat()))
-    trend_data = {row[0]: row[1] for row in c.fetchall()}
-
-    current = date.fromisoformat(start_date)
-    trend_labels = []
-    trend_values = []
-    while current <= today:
-        trend_labels.append(current.strftime('%Y-%m-%d'))
-        trend_values.append(trend_data.get(current.isoformat(), 0))
-        current += timedelta(days=1)
-
-    c.execute('''SELECT strftime('%Y-%m', date) as month, SUM(amount) 
-                 FROM expenses WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY month ORDER BY month''',
-              (profile_id, start_date, today.isoformat()))
-    expense_by_month = {row[0]: row[1] for row in c.fetchall()}
-
-    c.execute('''SELECT strftime('%Y-%m', date) as month, SUM(amount) 
-                 FROM income WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY month ORDER BY month''',
-              (profile_id, start_date, today.isoformat()))
-    income_by_month = {row[0]: row[1] for row in c.fetchall()}
-
-    all_months = sorted(set(list(expense_by_month.keys()) + list(income_by_month.keys())))
-    income_data = [income_by_month.get(m, 0) for m in all_months]
-    expense_data = [expense_by_month.get(m, 0) for m in all_months]
+    trend_labels = trend_labels_for(trend_start, today, resolution, max_points)
+    trend_values = [agg['by_bucket'].get(label, 0) for label in trend_labels]
 
-    conn.close()
+    all_months = sorted(set(agg['expense_by_month']) | set(agg['income_by_month']))
+    income_data = [agg['income_by_month'].get(m, 0) for m in all_months]
+    expense_data = [agg['expense_by_month'].get(m, 0) for m in all_months]
+    total_expenses = agg['total_expenses']
 
     return jsonify({
         'total_expenses': total_expenses,
         'avg_daily': total_expenses / days if days > 0 else 0,
-        'transaction_count': transaction_count,
+        'transaction_count': agg['transaction_count'],
         'highest_category': highest_category,
         'by_category': by_category,
-        'by_payment': by_payment,
+        'by_payment': agg['by_payment'],
         'trend_labels': trend_labels,
         'trend_data': trend_values,
+        'trend_resolution': resolution,
         'income_expense_labels': all_months,
         'income_data': income_data,
         'expense_data': expense_data
     })
 
+@app.route('/api/analytics/merchants')
+@cached_result
+def merchant_analytics():
+    # Card spend by canonical merchant, so 'SWIGGY*ORDER 123' and 'Swiggy Bangalore' add up
+    profile_id = get_profile_id()
+    period = request.args.get('period', 'monthly')
+    limit = request.args.get('limit', 20, type=int)
+    if not 1 <= limit <= 100:
+        return jsonify({'error': 'limit must be between 1 and 100'}), 400
+
+    today = date.today()
+    end_date = today.isoformat()
+    if period == 'daily':
+        start_date = end_date
+    elif period == 'monthly':
+        start_date = today.replace(day=1).isoformat()
+    elif period == 'yearly':
+        start_date = today.replace(month=1, day=1).isoformat()
+    elif period == 'custom' and request.args.get('start') and request.args.get('end'):
+        try:
+            start_date = date.fromisoformat(request.args['start']).isoformat()
+            end_date = date.fromisoformat(request.args['end']).isoformat()
+        except ValueError:
+            return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+    else:
+        start_date = '1970-01-01'
+
+    c = get_db().cursor()
+    # The covering (profile_id, date, merchant_id, amount) index serves the scan
+    c.execute('''SELECT s.merchant_id, COALESCE(m.name, 'Unknown'), s.txn_count, s.total
+                 FROM (SELECT merchant_id, COUNT(*) AS txn_count, SUM(amount) AS total
+                       FROM credit_statements WHERE profile_id = ? AND date >= ? AND date <= ?
+                       GROUP BY merchant_id) s
+                 LEFT JOIN merchants m ON m.id = s.merchant_id
+                 ORDER BY s.total DESC''', (profile_id, start_date, end_date))
+    rows = c.fetchall()
+    total = sum(row[3] for row in rows)
+    return jsonify({
+        'start': start_date,
+        'end': end_date,
+        'total': total,
+        'merchant_count': len(rows),
+        'merchants': [{'id': merchant_id, 'name': name, 'transaction_count': n, 'total': amount,
+                       'share': round(amount / total, 4) if total else 0}
+                      for merchant_id, name, n, amount in rows[:limit]],
+    })
+
+@app.route('/api/merchants')
+@conditional_get('merchants')
+def merchants():
+    profile_id = get_profile_id()
+    c = get_db().cursor()
+    c.execute('''SELECT m.id, m.name, COUNT(a.alias) FROM merchants m
+                 LEFT JOIN merchant_aliases a ON a.profile_id = m.profile_id AND a.merchant_id = m.id
+                 WHERE m.profile_id = ? GROUP BY m.id ORDER BY m.name''', (profile_id,))
+    return jsonify([{'id': row[0], 'name': row[1], 'alias_count': row[2]} for row in c.fetchall()])
+
+@app.route('/api/merchants/<int:merchant_id>', methods=['PUT'])
+def rename_merchant(merchant_id):
+    profile_id = get_profile_id()
+    body = request.get_json(silent=True)
+    name = body.get('name') if isinstance(body, dict) else None
+    if not isinstance(name, str) or not name.strip():
+        return jsonify({'error': 'name is required'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('UPDATE merchants SET name = ? WHERE id = ? AND profile_id = ?', (name.strip(), merchant_id, profile_id))
+    if c.rowcount == 0:
+        conn.rollback()
+        return jsonify({'error': 'Not found'}), 404
+    bump_data_version(c, profile_id, 'merchants')
+    conn.commit()
+    return jsonify({'success': True})
+
+@app.route('/api/merchants/<int:merchant_id>/merge', methods=['POST'])
+def merge_merchant(merchant_id):
+    # Folds a merchant into another: its aliases and statements move, its trigrams go
+    profile_id = get_profile_id()
+    body = request.get_json(silent=True)
+    target = body.get('into') if isinstance(body, dict) else None
+    if not isinstance(target, int) or isinstance(target, bool) or target == merchant_id:
+        return jsonify({'error': 'into must be another merchant id'}), 400
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        c.execute('SELECT COUNT(*) FROM merchants WHERE profile_id = ? AND id IN (?, ?)',
+                  (profile_id, merchant_id, target))
+        if c.fetchone()[0] != 2:
+            conn.rollback()
+            return jsonify({'error': 'Not found'}), 404
+        c.execute('UPDATE merchant_aliases SET merchant_id = ? WHERE profile_id = ? AND merchant_id = ?',
+                  (target, profile_id, merchant_id))
+        c.execute('UPDATE credit_statements SET merchant_id = ? WHERE profile_id = ? AND merchant_id = ?',
+                  (target, profile_id, merchant_id))
+        moved = c.rowcount
+        c.execute('DELETE FROM merchant_trigrams WHERE profile_id = ? AND merchant_id = ?', (profile_id, merchant_id))
+        c.execute('DELETE FROM merchants WHERE id = ?', (merchant_id,))
+        bump_data_version(c, profile_id, 'merchants', 'credit_statements')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return jsonify({'success': True, 'statements_moved': moved})
+
 @app.route('/api/budgets', methods=['GET'])
+@conditional_get('budgets')
+@cached_result
 def get_budgets():
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("SELECT amount FROM budgets WHERE profile_id = ? AND category = 'MONTHLY' AND period = 'monthly'", (profile_id,))
@@ -2420,38 +4199,566 @@ def get_budgets():
     c.execute("SELECT category, amount FROM budgets WHERE profile_id = ? AND category != 'MONTHLY'", (profile_id,))
     categories = {row[0]: row[1] for row in c.fetchall()}
 
-    conn.close()
     return jsonify({'monthly': monthly, 'categories': categories})
 
 @app.route('/api/budgets/monthly', methods=['POST'])
 def set_monthly_budget():
     profile_id = get_profile_id()
     amount = request.json['amount']
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute("DELETE FROM budgets WHERE profile_id = ? AND category = 'MONTHLY' AND period = 'monthly'", (profile_id,))
     c.execute("INSERT INTO budgets (profile_id, category, amount, period) VALUES (?, 'MONTHLY', ?, 'monthly')", (profile_id, amount))
+    bump_data_version(c, profile_id, 'budgets')
 
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
 @app.route('/api/budgets/categories', methods=['POST'])
 def set_category_budgets():
     profile_id = get_profile_id()
     budgets = request.json['budgets']
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     for category, amount in budgets.items():
         c.execute("DELETE FROM budgets WHERE profile_id = ? AND category = ? AND period = 'monthly'", (profile_id, category))
         c.execute("INSERT INTO budgets (profile_id, category, amount, period) VALUES (?, ?, ?, 'monthly')", (profile_id, category, amount))
+    bump_data_version(c, profile_id, 'budgets')
 
     conn.commit()
-    conn.close()
     return jsonify({'success': True})
 
+def normalize_header(name):
+    return ' '.join(name.strip().lower().split())
+
+class StatementLayout:
+    # One bank's CSV statement format. detect_layout() matches it against the header
+    # row once per file, and compile() resolves column positions, the date parser and
+    # the amount cleaner up front, returning a converter that turns a row list into
+    # (date, merchant, amount, category), or None for a credit (payment or refund).
+    #
+    # Sign conventions: a single `amount` column whose `indicator` column marks
+    # credits, separate `debit`/`credit` columns, or (legacy) an unsigned amount
+    # where every row is a spend.
+
+    def __init__(self, name, date, merchant, amount=None, debit=None, indicator=None,
+                 credit_marks=('cr',), category=None, date_format=None, currency='₹', match=None):
+        self.name = name
+        self.date = date
+        self.merchant = merchant
+        self.amount = amount
+        self.debit = debit
+        self.indicator = indicator
+        self.credit_marks = frozenset(credit_marks)
+        self.category = category
+        self.date_format = date_format
+        self.currency = currency
+        # Header columns that identify the layout; by default every mapped column but category
+        self.required = match or [names for names in (date, merchant, amount, debit, indicator) if names]
+
+    @staticmethod
+    def _index(columns, names):
+        for name in names:
+            if name in columns:
+                return columns[name]
+        return None
+
+    def matches(self, columns):
+        return all(self._index(columns, names) is not None for names in self.required)
+
+    def compile(self, columns):
+        date_i = self._index(columns, self.date)
+        merchant_i = self._index(columns, self.merchant)
+        amount_i = self._index(columns, self.amount or self.debit)
+        indicator_i = self._index(columns, self.indicator) if self.indicator else None
+        category_i = self._index(columns, self.category) if self.category else None
+        credit_marks = self.credit_marks
+        separate_debit = self.debit is not None
+        strip = str.maketrans('', '', ', \t' + self.currency)
+
+        fmt = self.date_format
+        if fmt is None:
+            to_iso = str
+        else:
+            # Statements repeat a few dozen dates across thousands of rows
+            dates = {}
+            def to_iso(value):
+                iso = dates.get(value)
+                if iso is None:
+                    iso = dates[value] = datetime.strptime(value.strip(), fmt).date().isoformat()
+                return iso
+
+        def convert(row):
+            raw = row[amount_i].translate(strip)
+            if separate_debit:
+                if not raw:
+                    return None
+            elif indicator_i is not None and row[indicator_i].strip().lower() in credit_marks:
+                return None
+            category = row[category_i] if category_i is not None else 'Miscellaneous'
+            return (to_iso(row[date_i]), row[merchant_i] if merchant_i is not None else '',
+                    abs(float(raw)), category or 'Miscellaneous')
+
+        return convert
+
+# Most specific first: the generic layout accepts any file with date and amount columns
+STATEMENT_LAYOUTS = [
+    StatementLayout('hdfc-credit-card', date=('date',), merchant=('transaction description',),
+                    amount=('amount',), indicator=('debit / credit',), date_format='%d/%m/%Y'),
+    StatementLayout('icici-credit-card', date=('date',), merchant=('transaction details',),
+                    amount=('amount(in rs)', 'amount (in rs)'), indicator=('billingamountsign',),
+                    date_format='%d/%m/%Y'),
+    StatementLayout('sbi-card', date=('date',), merchant=('transaction details',), amount=('amount',),
+                    indicator=('type',), credit_marks=('c', 'cr', 'credit'), date_format='%d %b %y'),
+    StatementLayout('axis-bank', date=('tran date',), merchant=('particulars',), debit=('dr', 'debit'),
+                    date_format='%d-%m-%Y'),
+    StatementLayout('kotak-bank', date=('transaction date',), merchant=('description',), amount=('amount',),
+                    indicator=('dr / cr', 'dr/cr'), date_format='%d-%m-%Y'),
+    StatementLayout('sbi-bank', date=('txn date',), merchant=('description',), debit=('debit',),
+                    date_format='%d %b %Y'),
+    StatementLayout('generic', date=('date',), merchant=('merchant', 'description'), amount=('amount',),
+                    category=('category',), match=[('date',), ('amount',)]),
+]
+
+def detect_layout(header):
+    columns = {}
+    for i, name in enumerate(header):
+        columns.setdefault(normalize_header(name), i)
+    for layout in STATEMENT_LAYOUTS:
+        if layout.matches(columns):
+            return layout, layout.compile(columns)
+    raise ValueError('Unrecognized statement layout: ' + ', '.join(header))
+
+def parse_statement(stream, profile_id, card_name, report):
+    # Detects the layout from the header row, then returns a generator of staged rows
+    # (date, merchant, amount, category, fingerprint). Credits and rows that fail to
+    # parse are tallied in `report` as the generator is consumed. Without a card name
+    # the layout names the card: duplicates are found per card, so the key must not
+    # change between two downloads of one card's statement (as a file name does).
+    reader = csv.reader(stream)
+    try:
+        header = next(reader, None) or []
+    except csv.Error as e:
+        raise ValueError(f'Unreadable statement header: {e}')
+    layout, convert = detect_layout(header)
+    card_name = card_name or layout.name
+    report.update(layout=layout.name, card_name=card_name, skipped_credits=0, rejected=[])
+    rejected = report['rejected']
+
+    def rows():
+        occurrences = defaultdict(int)
+        while True:
+            # A malformed line (an oversized or unterminated quoted field) rejects
+            # that line; the reader resumes at the next one
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                rejected.append({'line': reader.line_num, 'error': str(e)})
+                continue
+            if not row:
+                continue
+            try:
+                parsed = convert(row)
+            except IndexError:
+                rejected.append({'line': reader.line_num, 'error': 'missing columns'})
+                continue
+            except ValueError as e:
+                rejected.append({'line': reader.line_num, 'error': str(e)})
+                continue
+            if parsed is None:
+                report['skipped_credits'] += 1
+                continue
+            date_str, merchant, amount, category = parsed
+            key = (date_str, round(amount, 2), normalize_merchant(merchant))
+            yield (date_str, merchant, amount, category,
+                   statement_fingerprint(profile_id, card_name, date_str, amount, merchant, occurrences[key]))
+            occurrences[key] += 1
+
+    return rows()
+
+def parse_statement_file(payload, profile_id, card_name):
+    # Runs in a parse worker process: the whole file is decoded and converted there,
+    # and only the staged rows and the report travel back to the writer.
+    report = {}
+    stream = io.TextIOWrapper(io.BytesIO(payload), encoding='utf-8-sig', newline='')
+    rows = list(parse_statement(stream, profile_id, card_name, report))
+    return rows, report
+
+def write_statement(conn, profile_id, card_name, rows, report, job_id=None, on_batch=None):
+    # Inserts staged rows in executemany batches inside one transaction and completes
+    # `report`. on_batch(imported, rejected_count) runs after each batch is written,
+    # still inside the transaction, so a caller may commit there and begin the next one.
+    # Rows whose fingerprint is already stored were imported before and are skipped.
+    imported_at = datetime.now().isoformat()
+    batch_size = app.config['IMPORT_BATCH_SIZE']
+    imported = 0
+    skipped = 0
+    c = conn.cursor()
+
+    # Batches land in a temp staging table, then move with one INSERT ... SELECT per
+    # target. A single statement per batch keeps the FTS triggers from flushing the
+    # full-text index once per row, and lets the rollup update aggregate in SQL.
+    c.execute('''CREATE TEMP TABLE IF NOT EXISTS statement_staging
+                 (date TEXT, merchant TEXT, amount REAL, category TEXT, fingerprint BLOB, merchant_id INTEGER,
+                  category_id INTEGER)''')
+    merchants = MerchantIndex(c, profile_id)
+
+    def flush(batch):
+        nonlocal skipped
+        c.execute('DELETE FROM statement_staging')
+        categories = dimension_ids(c, 'categories', profile_id, {row[3] for row in batch})
+        c.executemany('''INSERT INTO statement_staging (date, merchant, amount, category, fingerprint, category_id)
+                         VALUES (?, ?, ?, ?, ?, ?)''',
+                      [(*row, categories.get(row[3])) for row in batch])
+        # One unique-index probe per row, not a scan of the statement history
+        c.execute('''DELETE FROM statement_staging WHERE EXISTS
+                     (SELECT 1 FROM credit_statements WHERE fingerprint = statement_staging.fingerprint)''')
+        skipped += c.rowcount
+        # Merchants resolve only for rows that will be stored: a re-uploaded statement
+        # must not add aliases or merchants for lines it skips
+        c.execute('SELECT rowid, merchant FROM statement_staging')
+        staged = c.fetchall()
+        c.executemany('UPDATE statement_staging SET merchant_id = ? WHERE rowid = ?',
+                      zip(merchants.resolve_many(merchant for _, merchant in staged), (rowid for rowid, _ in staged)))
+        c.execute('''INSERT INTO credit_statements
+                     (profile_id, card_name, amount, merchant, category, date, uploaded_date, import_job_id,
+                      fingerprint, merchant_id)
+                     SELECT ?, ?, amount, merchant, category, date, ?, ?, fingerprint, merchant_id
+                     FROM statement_staging''',
+                  (profile_id, card_name, imported_at, job_id))
+        inserted = c.rowcount
+        c.execute('''INSERT INTO expenses
+                     (profile_id, amount, description, payment_method_id, category_id, date, timestamp, import_job_id)
+                     SELECT ?, amount, merchant, ?, category_id, date, ?, ? FROM statement_staging''',
+                  (profile_id, card_method_id, imported_at, job_id))
+        c.execute('''INSERT INTO expense_daily_rollup (profile_id, date, category_id, payment_method_id, txn_count, total)
+                     SELECT ?, date, COALESCE(category_id, 0), ?, COUNT(*), SUM(amount)
+                     FROM statement_staging WHERE true GROUP BY date, COALESCE(category_id, 0)
+                     ON CONFLICT (profile_id, date, category_id, payment_method_id)
+                     DO UPDATE SET txn_count = txn_count + excluded.txn_count, total = total + excluded.total''',
+                  (profile_id, card_method_id))
+        bump_data_version(c, profile_id, 'credit_statements', 'expenses', 'merchants')
+        if on_batch:
+            on_batch(imported + inserted, len(report['rejected']))
+        return inserted
+
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        card_method_id = dimension_ids(c, 'payment_methods', profile_id, ['Credit Card'])['Credit Card']
+        matcher = rule_matcher(c, profile_id)
+        if matcher.rules:
+            rows = matcher.categorize(rows)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                imported += flush(batch)
+                batch = []
+        if batch:
+            imported += flush(batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    rejected = report.pop('rejected')
+    report.update(imported=imported, skipped_duplicates=skipped, rejected_count=len(rejected),
+                  rejected=rejected[:app.config['IMPORT_MAX_REJECTS_REPORTED']])
+    return report
+
+def import_statement(conn, profile_id, card_name, stream, job_id=None, on_batch=None):
+    # Parses a CSV statement from a text stream as it is written, so memory stays flat
+    started = time.perf_counter()
+    report = {}
+    rows = parse_statement(stream, profile_id, card_name, report)
+    write_statement(conn, profile_id, report['card_name'], rows, report, job_id, on_batch)
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+# Background imports. Uploads are stored in import_jobs and picked up by worker threads,
+# so a request only pays for receiving the file. Files are parsed in a process pool,
+# so several uploads convert on separate cores, while writes go through one writer
+# thread per process at a time (SQLite has a single writer anyway; the lock just keeps
+# finished parses from queueing on busy_timeout). A job commits after every batch
+# (other writers get the lock between batches and pollers see live progress); if it is
+# cancelled or fails, the rows tagged with its id are removed again, so a job still
+# lands all or nothing. A running job renews its heartbeat while it waits and after
+# every batch; one whose process died is reclaimed by the next worker that polls.
+class ImportCancelled(Exception):
+    pass
+
+class ImportReclaimed(Exception):
+    pass
+
+import_write_lock = threading.Lock()
+# Jobs this process is running. They all wait on import_write_lock, so whichever one
+# holds it renews the others' leases with its own batches.
+running_imports = set()
+running_imports_lock = threading.Lock()
+
+def parse_pool(processes):
+    # Parse processes start from a fresh interpreter (a fork server where the platform
+    # has one) instead of forking an app process mid-flight: a fork copies the pooled
+    # SQLite connections and whatever locks the worker threads held at that moment.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=processes, mp_context=context)
+
+def enqueue_import(c, profile_id, filename, card_name, payload):
+    c.execute('''INSERT INTO import_jobs (profile_id, filename, card_name, status, payload, payload_bytes, created_date)
+                 VALUES (?, ?, ?, 'queued', ?, ?, ?)''',
+              (profile_id, filename, card_name, payload, len(payload), datetime.now().isoformat()))
+    return c.lastrowid
+
+def claim_import_job(conn):
+    # The conditional UPDATE is the claim: only one worker (in any process) sees rowcount 1
+    c = conn.cursor()
+    while True:
+        c.execute("SELECT id FROM import_jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+        row = c.fetchone()
+        if row is None:
+            return None
+        now = datetime.now().isoformat()
+        c.execute('''UPDATE import_jobs SET status = 'running', started_date = ?, heartbeat_date = ?
+                     WHERE status = 'queued' AND id = ?''', (now, now, row[0]))
+        conn.commit()
+        if c.rowcount == 1:
+            return row[0]
+
+def renew_import_lease(c, job_id):
+    # False once the job has been reclaimed: its rows are gone and it is no longer ours.
+    # The other jobs of this process are renewed along with it.
+    with running_imports_lock:
+        others = sorted(running_imports - {job_id})
+    now = datetime.now().isoformat()
+    if others:
+        c.execute('''UPDATE import_jobs SET heartbeat_date = ?
+                     WHERE status = 'running' AND id IN (SELECT value FROM json_each(?))''',
+                  (now, json.dumps(others)))
+    c.execute('''UPDATE import_jobs SET heartbeat_date = ? WHERE status = 'running' AND id = ?''', (now, job_id))
+    return c.rowcount == 1
+
+def heartbeat(job_id):
+    # While another job of this process holds the write lock it is alive and renews this
+    # one after every batch; writing here would only queue behind its transactions.
+    if not import_write_lock.acquire(blocking=False):
+        return
+    try:
+        with pool.connection() as conn:
+            lease_held = renew_import_lease(conn.cursor(), job_id)
+            conn.commit()
+    except sqlite3.OperationalError as e:
+        # Another process is writing; the lease outlasts a few missed renewals
+        app.logger.warning('Import job %d heartbeat skipped: %s', job_id, e)
+        return
+    finally:
+        import_write_lock.release()
+    if not lease_held:
+        raise ImportReclaimed()
+
+def reap_import_jobs(conn):
+    # Fails jobs left 'running' by a process that died mid-import, removing the rows
+    # its committed batches wrote. They are not re-queued: a file that crashed its
+    # worker would crash the next one too.
+    c = conn.cursor()
+    cutoff = (datetime.now() - timedelta(seconds=app.config['IMPORT_LEASE_SECONDS'])).isoformat()
+    c.execute('''SELECT id, profile_id FROM import_jobs
+                 WHERE status = 'running' AND (heartbeat_date IS NULL OR heartbeat_date < ?)''', (cutoff,))
+    stale = c.fetchall()
+    with running_imports_lock:
+        stale = [(job_id, profile_id) for job_id, profile_id in stale if job_id not in running_imports]
+    for job_id, profile_id in stale:
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute('''UPDATE import_jobs SET status = 'failed', error = 'Interrupted: the import worker stopped',
+                         rows_processed = 0, rows_rejected = 0, payload = NULL, finished_date = ?
+                         WHERE status = 'running' AND id = ? AND (heartbeat_date IS NULL OR heartbeat_date < ?)''',
+                      (datetime.now().isoformat(), job_id, cutoff))
+            if c.rowcount == 1:
+                discard_import_rows(c, job_id, profile_id)
+                app.logger.warning('Import job %d reclaimed after its worker stopped', job_id)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def discard_import_rows(c, job_id, profile_id):
+    c.execute('''INSERT INTO expense_daily_rollup (profile_id, date, category_id, payment_method_id, txn_count, total)
+                 SELECT profile_id, date, COALESCE(category_id, 0), COALESCE(payment_method_id, 0), -COUNT(*), -SUM(amount)
+                 FROM expenses WHERE import_job_id = ?
+                 GROUP BY profile_id, date, COALESCE(category_id, 0), COALESCE(payment_method_id, 0)
+                 ON CONFLICT (profile_id, date, category_id, payment_method_id)
+                 DO UPDATE SET txn_count = txn_count + excluded.txn_count, total = total + excluded.total''',
+              (job_id,))
+    c.execute('DELETE FROM expense_daily_rollup WHERE profile_id = ? AND txn_count <= 0', (profile_id,))
+    c.execute('DELETE FROM expenses WHERE import_job_id = ?', (job_id,))
+    c.execute('DELETE FROM credit_statements WHERE import_job_id = ?', (job_id,))
+    bump_data_version(c, profile_id, 'credit_statements', 'expenses')
+
+def run_import_job(job_id, executor):
+    with running_imports_lock:
+        running_imports.add(job_id)
+    try:
+        process_import_job(job_id, executor)
+    finally:
+        with running_imports_lock:
+            running_imports.discard(job_id)
+
+def process_import_job(job_id, executor):
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT profile_id, card_name, payload FROM import_jobs WHERE id = ?', (job_id,))
+        profile_id, card_name, payload = c.fetchone()
+
+    report, error = None, None
+    started = time.perf_counter()
+    renew_every = app.config['IMPORT_LEASE_SECONDS'] / 4
+    try:
+        future = executor.submit(parse_statement_file, payload, profile_id, card_name)
+        while not wait([future], timeout=renew_every).done:
+            heartbeat(job_id)
+        rows, report = future.result()
+        del payload
+        # No heartbeat while blocked here: the holder renews this job's lease
+        import_write_lock.acquire()
+        try:
+            with pool.connection() as conn:
+                c = conn.cursor()
+
+                def on_batch(processed, rejected_count):
+                    # Checked inside the batch's transaction, so a reclaimed job never
+                    # commits another batch
+                    if not renew_import_lease(c, job_id):
+                        raise ImportReclaimed()
+                    c.execute('UPDATE import_jobs SET rows_processed = ?, rows_rejected = ? WHERE id = ?',
+                              (processed, rejected_count, job_id))
+                    c.execute('SELECT cancel_requested FROM import_jobs WHERE id = ?', (job_id,))
+                    if c.fetchone()[0]:
+                        raise ImportCancelled()
+                    conn.commit()
+                    c.execute('BEGIN IMMEDIATE')
+
+                write_statement(conn, profile_id, report['card_name'], rows, report, job_id, on_batch)
+        finally:
+            import_write_lock.release()
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        status = 'completed'
+    except ImportReclaimed:
+        app.logger.warning('Import job %d was reclaimed while running', job_id)
+        return
+    except ImportCancelled:
+        status = 'cancelled'
+    except UnicodeDecodeError:
+        status, error = 'failed', 'Statement is not UTF-8 text'
+    except ValueError as e:
+        status, error = 'failed', str(e)
+    except Exception as e:
+        app.logger.exception('Import job %d failed', job_id)
+        status, error = 'failed', str(e)
+
+    # Under the write lock like the batches, so the final status never waits out
+    # busy_timeout behind another job's writes
+    with import_write_lock, pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute('SELECT status FROM import_jobs WHERE id = ?', (job_id,))
+            if c.fetchone()[0] != 'running':
+                # Reclaimed since the last heartbeat, which already discarded its rows
+                conn.rollback()
+                app.logger.warning('Import job %d was reclaimed while running', job_id)
+                return
+            if status != 'completed':
+                discard_import_rows(c, job_id, profile_id)
+                report, processed, rejected_count = None, 0, 0
+            else:
+                processed, rejected_count = report['imported'], report['rejected_count']
+            c.execute('''UPDATE import_jobs SET status = ?, rows_processed = ?, rows_rejected = ?, report = ?,
+                         error = ?, payload = NULL, finished_date = ? WHERE id = ?''',
+                      (status, processed, rejected_count, json.dumps(report) if report else None, error,
+                       datetime.now().isoformat(), job_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    app.logger.info('Import job %d %s', job_id, status)
+
+class ImportWorkers:
+    def __init__(self, count, processes):
+        self.count = count
+        self.processes = processes
+        self.executor = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        # Threads and pools do not survive a fork, so each worker process starts its own
+        # on first use. Parse processes start lazily and only run parse_statement_file.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.executor = parse_pool(self.processes)
+            for i in range(self.count):
+                threading.Thread(target=self._run, name=f'import-worker-{i}', daemon=True).start()
+
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                with pool.connection() as conn:
+                    # Only when no job here is writing, so the reaper does not queue behind it
+                    if import_write_lock.acquire(blocking=False):
+                        try:
+                            reap_import_jobs(conn)
+                        finally:
+                            import_write_lock.release()
+                    job_id = claim_import_job(conn)
+                if job_id is not None:
+                    run_import_job(job_id, self.executor)
+            except Exception:
+                app.logger.exception('Import worker error')
+                job_id = None
+            if job_id is None:
+                self._wake.wait(app.config['IMPORT_POLL_INTERVAL'])
+                self._wake.clear()
+
+import_workers = ImportWorkers(app.config['IMPORT_WORKERS'], app.config['IMPORT_PARSE_PROCESSES'])
+
+def import_job_json(row):
+    (job_id, filename, status, payload_bytes, processed, rejected, report, error,
+     created, started, finished) = row
+    elapsed = None
+    if started:
+        end = datetime.fromisoformat(finished) if finished else datetime.now()
+        elapsed = max((end - datetime.fromisoformat(started)).total_seconds(), 0.0)
+    return {
+        'id': job_id,
+        'filename': filename,
+        'status': status,
+        'bytes': payload_bytes,
+        'rows_processed': processed,
+        'rows_rejected': rejected,
+        'rows_per_second': round(processed / elapsed, 1) if elapsed else None,
+        'elapsed_seconds': round(elapsed, 3) if elapsed is not None else None,
+        'report': json.loads(report) if report else None,
+        'error': error,
+        'created_date': created,
+        'started_date': started,
+        'finished_date': finished,
+    }
+
+IMPORT_JOB_COLUMNS = '''id, filename, status, payload_bytes, rows_processed, rows_rejected, report, error,
+                         created_date, started_date, finished_date'''
+
 @app.route('/api/credit/upload', methods=['POST'])
 def upload_credit_statement():
     profile_id = get_profile_id()
@@ -2464,86 +4771,1016 @@ def upload_credit_statement():
 
     if file and file.filename.endswith('.csv'):
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        # Duplicates are detected per card; without a card name the statement layout stands in
+        card_name = request.form.get('card', '').strip() or None
+        if request.args.get('sync') == '1':
+            stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+            try:
+                report = import_statement(get_db(), profile_id, card_name, stream)
+            except UnicodeDecodeError:
+                return jsonify({'error': 'Statement is not UTF-8 text'}), 400
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            return jsonify({'success': True, **report})
+
+        conn = get_db()
+        job_id = enqueue_import(conn.cursor(), profile_id, filename, card_name, file.read())
+        conn.commit()
+        import_workers.notify()
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'queued',
+                        'status_url': f'/api/imports/{job_id}'}), 202
 
-        conn = sqlite3.connect('expenses.db')
-        c = conn.cursor()
+    return jsonify({'error': 'Invalid file format'}), 400
 
-        with open(filepath, 'r', encoding='utf-8-sig') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                try:
-                    date_str = row.get('Date', row.get('date', ''))
-                    merchant = row.get('Merchant', row.get('merchant', row.get('Description', '')))
-                    amount = float(row.get('Amount', row.get('amount', '0')).replace(',', '').replace('₹', ''))
-                    category = row.get('Category', row.get('category', 'Miscellaneous'))
-
-                    c.execute('''INSERT INTO credit_statements 
-                                (profile_id, card_name, amount, merchant, category, date, uploaded_date)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                              (profile_id, filename, abs(amount), merchant, category, date_str, datetime.now().isoformat()))
-
-                    c.execute('''INSERT INTO expenses 
-                                (profile_id, amount, description, payment_method, category, date, timestamp)
-                                VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                              (profile_id, abs(amount), merchant, 'Credit Card', category, date_str, datetime.now().isoformat()))
-                except Exception as e:
-                    print(f"Error processing row: {e}")
-                    continue
+@app.route('/api/credit/upload/batch', methods=['POST'])
+def upload_credit_statements():
+    # Month-end uploads: one import job per file, parsed side by side by the workers
+    profile_id = get_profile_id()
+    files = [file for file in request.files.getlist('file') if file.filename]
+    if not files:
+        return jsonify({'error': 'No file selected'}), 400
+    invalid = [file.filename for file in files if not file.filename.endswith('.csv')]
+    if invalid:
+        return jsonify({'error': 'Invalid file format', 'files': invalid}), 400
 
-        conn.commit()
-        conn.close()
+    card = request.form.get('card', '').strip()
+    conn = get_db()
+    c = conn.cursor()
+    jobs = []
+    for file in files:
+        filename = secure_filename(file.filename)
+        job_id = enqueue_import(c, profile_id, filename, card or None, file.read())
+        jobs.append({'job_id': job_id, 'filename': filename, 'status': 'queued',
+                     'status_url': f'/api/imports/{job_id}'})
+    conn.commit()
+    import_workers.notify()
+    return jsonify({'success': True, 'jobs': jobs}), 202
 
-        return jsonify({'success': True})
+@app.route('/api/imports')
+def list_import_jobs():
+    profile_id = get_profile_id()
+    c = get_db().cursor()
+    c.execute(f'''SELECT {IMPORT_JOB_COLUMNS} FROM import_jobs
+                  WHERE profile_id = ? ORDER BY id DESC LIMIT 20''', (profile_id,))
+    return jsonify([import_job_json(row) for row in c.fetchall()])
 
-    return jsonify({'error': 'Invalid file format'}), 400
+@app.route('/api/imports/<int:job_id>')
+def get_import_job(job_id):
+    profile_id = get_profile_id()
+    c = get_db().cursor()
+    c.execute(f'SELECT {IMPORT_JOB_COLUMNS} FROM import_jobs WHERE id = ? AND profile_id = ?',
+              (job_id, profile_id))
+    row = c.fetchone()
+    if row is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    if row[2] in ('queued', 'running'):
+        # Picks up jobs left queued, or reclaims jobs left running, by a restarted process
+        import_workers.start()
+    return jsonify(import_job_json(row))
+
+@app.route('/api/imports/<int:job_id>/cancel', methods=['POST'])
+def cancel_import_job(job_id):
+    profile_id = get_profile_id()
+    conn = get_db()
+    c = conn.cursor()
+    # A queued job is cancelled outright; a running one stops at its next batch boundary
+    c.execute('''UPDATE import_jobs SET status = 'cancelled', payload = NULL, finished_date = ?
+                 WHERE status = 'queued' AND id = ? AND profile_id = ?''',
+              (datetime.now().isoformat(), job_id, profile_id))
+    c.execute('''UPDATE import_jobs SET cancel_requested = 1
+                 WHERE status = 'running' AND id = ? AND profile_id = ?''', (job_id, profile_id))
+    conn.commit()
+    c.execute(f'SELECT {IMPORT_JOB_COLUMNS} FROM import_jobs WHERE id = ? AND profile_id = ?',
+              (job_id, profile_id))
+    row = c.fetchone()
+    if row is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify(import_job_json(row))
 
 @app.route('/api/credit/statements')
+@conditional_get('credit_statements')
 def get_credit_statements():
     profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    conn = get_db()
     c = conn.cursor()
 
     c.execute('SELECT * FROM credit_statements WHERE profile_id = ? ORDER BY date DESC', (profile_id,))
-    statements = []
-    for row in c.fetchall():
-        statements.append({
-            'id': row[0], 'card_name': row[2], 'amount': row[3],
-            'merchant': row[4], 'category': row[5], 'date': row[6]
-        })
+    if request.args.get('stream') == '1':
+        return stream_json(c, statement_json)
+
+    return jsonify([statement_json(row) for row in c.fetchall()])
+
+def search_query(q):
+    # User input -> FTS5 query: "quoted phrases" stay phrases, a trailing * makes a
+    # prefix query, every other word must match. Punctuation never reaches FTS5.
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', q):
+        tokens = re.findall(r'\w+', phrase or word)
+        if not tokens:
+            continue
+        if phrase:
+            terms.append('"' + ' '.join(tokens) + '"')
+        else:
+            terms.extend(f'"{token}"' for token in tokens)
+            if word.endswith('*'):
+                terms[-1] += '*'
+    return ' AND '.join(terms)
+
+@app.route('/api/search')
+@conditional_get('expenses', 'credit_statements')
+def search():
+    profile_id = get_profile_id()
+    match = search_query(request.args.get('q', ''))
+    if not match:
+        return jsonify({'error': 'Missing search query'}), 400
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
 
-    conn.close()
-    return jsonify(statements)
+    conn = get_db()
+    c = conn.cursor()
+    c.execute('''SELECT rowid, bm25(transaction_search, 1.0, 0.0) FROM transaction_search
+                 WHERE transaction_search MATCH ? ORDER BY 2 LIMIT ?''',
+              (f'profile : "p{profile_id}" AND body : ({match})', limit))
+    hits = c.fetchall()
+
+    expense_ids = [rowid // 2 for rowid, _ in hits if rowid % 2 == 0]
+    statement_ids = [rowid // 2 for rowid, _ in hits if rowid % 2 == 1]
+    found = {}
+    if expense_ids:
+        c.execute(f'''SELECT id, amount, description, payment_method, category, date FROM {EXPENSE_ROWS}
+                      WHERE id IN ({', '.join('?' * len(expense_ids))})''', expense_ids)
+        for row in c.fetchall():
+            found[row[0] * 2] = {'type': 'expense', 'id': row[0], 'amount': row[1], 'description': row[2],
+                                 'paymentMethod': row[3], 'category': row[4], 'date': row[5]}
+    if statement_ids:
+        c.execute(f'''SELECT id, card_name, amount, merchant, category, date FROM credit_statements
+                      WHERE id IN ({', '.join('?' * len(statement_ids))})''', statement_ids)
+        for row in c.fetchall():
+            found[row[0] * 2 + 1] = {'type': 'credit_statement', 'id': row[0], 'card_name': row[1], 'amount': row[2],
+                                     'merchant': row[3], 'category': row[4], 'date': row[5]}
+
+    results = []
+    for rowid, score in hits:
+        if rowid in found:
+            found[rowid]['rank'] = score
+            results.append(found[rowid])
+    return jsonify(results)
+
+@app.route('/api/db/stats')
+def db_stats():
+    stats = pool.stats()
+    stats['profile'] = app.config['DB_PROFILE']
+    stats['pragmas'] = effective_pragmas(get_db())
+    return jsonify(stats)
+
+@app.route('/api/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
 
 @app.route('/api/export')
 def export_data():
-    profile_id = get_profile_id()
-    conn = sqlite3.connect('expenses.db')
+    # Rows go straight from the cursor through csv.writer into the response, a
+    # batch at a time (optionally gzipped on the fly), so memory stays constant.
+    export_type = request.args.get('type', 'all')
+    if export_type not in ('all', 'expense', 'income'):
+        return jsonify({'error': 'Invalid type, expected all, expense or income'}), 400
+    try:
+        start = date.fromisoformat(request.args.get('start', '0001-01-01')).isoformat()
+        end = date.fromisoformat(request.args.get('end', '9999-12-31')).isoformat()
+    except ValueError:
+        return jsonify({'error': 'Invalid start or end'}), 400
+    # The session's profile only, unless every profile (as listed by the profile
+    # switcher) is asked for explicitly; other profiles are never picked by id
+    profiles = request.args.get('profiles')
+    if profiles not in (None, 'all'):
+        return jsonify({'error': 'Invalid profiles, expected all'}), 400
+    with_profile = profiles == 'all'
+    compress = request.args.get('gzip') == '1'
+
+    conn = get_db()
     c = conn.cursor()
+    if with_profile:
+        c.execute('SELECT id, name FROM profiles ORDER BY id')
+    else:
+        c.execute('SELECT id, name FROM profiles WHERE id = ?', (get_profile_id(),))
+    names = dict(c.fetchall())
+    profile_ids = list(names)
+
+    queries = []
+    if export_type in ('all', 'expense'):
+        queries.append(('Expense', [], f'SELECT date, amount, category, description, payment_method FROM {EXPENSE_ROWS} '
+                                       'WHERE profile_id = ? AND date >= ? AND date <= ? ORDER BY date DESC'))
+    if export_type in ('all', 'income'):
+        # Income rows have no payment method column; pad it only when a Profile column follows
+        queries.append(('Income', [''] if with_profile else [], 'SELECT date, amount, source, type FROM income '
+                                                                'WHERE profile_id = ? AND date >= ? AND date <= ? ORDER BY date DESC'))
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        gz = zlib.compressobj(wbits=31) if compress else None
+
+        def drain():
+            data = buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            return gz.compress(data) if gz else data
+
+        header = ['Type', 'Date', 'Amount', 'Category', 'Description', 'Payment Method']
+        writer.writerow(header + ['Profile'] if with_profile else header)
+        for profile_id in profile_ids:
+            suffix = [names[profile_id]] if with_profile else []
+            for label, padding, query in queries:
+                cursor = conn.execute(query, (profile_id, start, end))
+                while True:
+                    rows = cursor.fetchmany(1000)
+                    if not rows:
+                        break
+                    writer.writerows([label, *row, *padding, *suffix] for row in rows)
+                    yield drain()
+        yield drain()
+        if gz:
+            yield gz.flush()
+
+    filename = f'expenses_export_{datetime.now().strftime("%Y%m%d")}.csv' + ('.gz' if compress else '')
+    return app.response_class(
+        stream_with_context(generate()),
+        mimetype='application/gzip' if compress else 'text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
 
-    output = io.StringIO()
-    writer = csv.writer(output)
+# Online snapshots. The source connection pins one WAL read transaction for the whole
+# copy, so every page-sized backup step sees the same consistent state while live
+# writers keep committing (WAL readers never block writers, and an unchanged snapshot
+# never forces the backup to restart).
+PROFILE_DATA_TABLES = ['expenses', 'income', 'categories', 'payment_methods', 'budgets', 'credit_statements',
+                       'category_rules']
+# Merchant tables are derived from statement merchants (ids differ after a profile restore)
+MERCHANT_TABLES = ['merchants', 'merchant_aliases', 'merchant_trigrams']
+PROFILE_TABLES = PROFILE_DATA_TABLES + ['expense_daily_rollup', 'income_daily_rollup', 'data_versions', 'table_versions',
+                                       'import_jobs'] + MERCHANT_TABLES
+
+def backup_database(src, dst, progress=None):
+    src.execute('BEGIN')
+    src.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+    try:
+        src.backup(dst, pages=app.config['SNAPSHOT_STEP_PAGES'], progress=progress,
+                   sleep=app.config['SNAPSHOT_STEP_SLEEP'])
+    finally:
+        src.rollback()
+    # The copy is a standalone file, not a WAL database with side files
+    dst.execute('PRAGMA journal_mode = DELETE')
+
+def write_snapshot(path, profile_id=None, progress=None):
+    dst = sqlite3.connect(path)
+    try:
+        with pool.connection() as src:
+            backup_database(src, dst, progress)
+        if profile_id is not None:
+            # Triggers keep the search index consistent while other profiles are removed
+            for table in PROFILE_TABLES:
+                dst.execute(f'DELETE FROM {table} WHERE profile_id != ?', (profile_id,))
+            dst.execute('DELETE FROM profiles WHERE id != ?', (profile_id,))
+            dst.commit()
+            dst.execute('VACUUM')
+        return dst.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        dst.close()
+
+def max_version(c):
+    c.execute('SELECT COALESCE(MAX(version), 0) FROM data_versions')
+    highest = c.fetchone()[0]
+    c.execute('SELECT COALESCE(MAX(version), 0) FROM table_versions')
+    return max(highest, c.fetchone()[0])
+
+def invalidate_versions(c, profile_ids, handed_out=0):
+    # After a restore, versions must move past every value handed out before it, or a
+    # cached result or ETag from the old data could match the restored data. A
+    # whole-database restore has already overwritten the counters by now, so its
+    # caller reads handed_out before the backup. The merchant tables are rebuilt
+    # with new ids, so their 'merchants' counter moves too.
+    offset = max(handed_out, max_version(c)) + 1
+    for profile_id in profile_ids:
+        c.execute('''INSERT INTO data_versions (profile_id, version) VALUES (?, ?)
+                     ON CONFLICT (profile_id) DO UPDATE SET version = version + excluded.version''',
+                  (profile_id, offset))
+        c.executemany('''INSERT INTO table_versions (profile_id, table_name, version) VALUES (?, ?, ?)
+                         ON CONFLICT (profile_id, table_name) DO UPDATE SET version = version + excluded.version''',
+                      [(profile_id, table, offset) for table in PROFILE_DATA_TABLES + ['merchants']])
+
+def snapshot_info(path):
+    try:
+        snap = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            version = snap.execute('SELECT MAX(version) FROM schema_version').fetchone()[0]
+            profiles = [row[0] for row in snap.execute('SELECT id FROM profiles ORDER BY id')]
+        finally:
+            snap.close()
+    except sqlite3.Error:
+        raise ValueError('Not an expense tracker snapshot')
+    if version is None or version > MIGRATIONS[-1][0]:
+        raise ValueError('Snapshot schema is newer than this application')
+    return version, profiles
+
+def restore_expenses(c, profile_id, target):
+    # Snapshot expenses hold the snapshot's dimension ids (or, before schema 12, the
+    # names themselves). Rows are re-keyed by name onto the target's dimension rows,
+    # already restored; a name missing from them is added as for a new row.
+    saved = {row[1] for row in c.execute('PRAGMA snapshot.table_info(expenses)')}
+    if 'category_id' in saved:
+        names = '''(SELECT name FROM snapshot.payment_methods WHERE id = e.payment_method_id) AS payment_method,
+                   (SELECT name FROM snapshot.categories WHERE id = e.category_id) AS category'''
+    else:
+        names = 'e.payment_method, e.category'
+    source = f'''(SELECT e.id, e.amount, e.description, {names}, e.date, e.timestamp
+                  FROM snapshot.expenses e WHERE e.profile_id = ?)'''
+    c.execute(f'''INSERT INTO categories (profile_id, name, deleted)
+                  SELECT DISTINCT ?, category, 1 FROM {source} WHERE category IS NOT NULL
+                  ON CONFLICT (profile_id, name) DO NOTHING''', (target, profile_id))
+    c.execute(f'''INSERT INTO payment_methods (profile_id, name)
+                  SELECT DISTINCT ?, payment_method FROM {source} WHERE payment_method IS NOT NULL
+                  ON CONFLICT (profile_id, name) DO NOTHING''', (target, profile_id))
+    c.execute(f'''INSERT INTO expenses (profile_id, amount, description, payment_method_id, category_id, date, timestamp)
+                  SELECT ?, r.amount, r.description, pm.id, cat.id, r.date, r.timestamp FROM {source} r
+                  LEFT JOIN payment_methods pm ON pm.profile_id = ? AND pm.name = r.payment_method
+                  LEFT JOIN categories cat ON cat.profile_id = ? AND cat.name = r.category
+                  ORDER BY r.id''', (target, profile_id, target, target))
+
+def restore_snapshot(path, profile_id=None, target_profile_id=None, progress=None):
+    # Whole-database restores copy the snapshot over the live file in a single backup
+    # step (one short exclusive lock, then migrations bring an older schema up to
+    # date). Profile restores replace just that profile's rows in one transaction.
+    _, snapshot_profiles = snapshot_info(path)
+    with pool.connection() as conn:
+        c = conn.cursor()
+        if profile_id is None:
+            c.execute('SELECT id FROM profiles')
+            before = [row[0] for row in c.fetchall()]
+            handed_out = max_version(c)
+            snap = sqlite3.connect(path)
+            try:
+                snap.backup(conn, progress=progress)
+            finally:
+                snap.close()
+            migrate_db(conn)
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('SELECT id FROM profiles')
+            invalidate_versions(c, set(before) | {row[0] for row in c.fetchall()}, handed_out)
+            # No worker owns the snapshot's unfinished jobs
+            c.execute('''UPDATE import_jobs SET status = 'failed', error = 'Interrupted by snapshot restore',
+                         payload = NULL, finished_date = ? WHERE status IN ('queued', 'running')''',
+                      (datetime.now().isoformat(),))
+            conn.commit()
+            return
 
-    writer.writerow(['Type', 'Date', 'Amount', 'Category', 'Description', 'Payment Method'])
+        if profile_id not in snapshot_profiles:
+            raise ValueError(f'Profile {profile_id} is not in the snapshot')
+        target = target_profile_id or profile_id
+        c.execute('ATTACH DATABASE ? AS snapshot', (path,))
+        try:
+            c.execute('BEGIN IMMEDIATE')
+            for table in PROFILE_DATA_TABLES:
+                live = [row[1] for row in c.execute(f'PRAGMA main.table_info({table})')]
+                saved = {row[1] for row in c.execute(f'PRAGMA snapshot.table_info({table})')}
+                columns = [col for col in live
+                           if col in saved and col not in ('id', 'profile_id', 'import_job_id', 'fingerprint', 'merchant_id')]
+                c.execute(f'DELETE FROM {table} WHERE profile_id = ?', (target,))
+                if not columns or table == 'expenses':
+                    # Table added after the snapshot was taken, or copied below
+                    continue
+                c.execute(f'''INSERT INTO main.{table} (profile_id, {', '.join(columns)})
+                              SELECT ?, {', '.join(columns)} FROM snapshot.{table} WHERE profile_id = ?''',
+                          (target, profile_id))
+            restore_expenses(c, profile_id, target)
+            rebuild_rollups(c, target)
+            assign_fingerprints(c, target)
+            for table in MERCHANT_TABLES:
+                c.execute(f'DELETE FROM {table} WHERE profile_id = ?', (target,))
+            canonicalize_statements(c, target)
+            invalidate_versions(c, [target])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            c.execute('DETACH DATABASE snapshot')
+
+def log_progress(label):
+    reported = [-1]
+    def progress(status, remaining, total):
+        percent = 100 * (total - remaining) // total if total else 100
+        if percent // 10 > reported[0]:
+            reported[0] = percent // 10
+            app.logger.info('%s: %d%% (%d/%d pages)', label, percent, total - remaining, total)
+    return progress
+
+@app.route('/api/export/snapshot')
+def export_snapshot():
+    scope = request.args.get('scope', 'profile')
+    if scope not in ('profile', 'all'):
+        return jsonify({'error': 'Invalid scope, expected profile or all'}), 400
+    profile_id = get_profile_id() if scope == 'profile' else None
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        pages = write_snapshot(path, profile_id, log_progress('Snapshot export'))
+    except Exception:
+        os.remove(path)
+        raise
+    response = send_file(path, mimetype='application/vnd.sqlite3', as_attachment=True,
+                         download_name=f'expenses_snapshot_{scope}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db')
+    response.headers['X-Snapshot-Pages'] = str(pages)
+    response.call_on_close(lambda: os.remove(path))
+    return response
+
+@app.route('/api/import/snapshot', methods=['POST'])
+def import_snapshot():
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file'}), 400
+    scope = request.form.get('scope', 'profile')
+    if scope not in ('profile', 'all'):
+        return jsonify({'error': 'Invalid scope, expected profile or all'}), 400
+    if scope == 'all' and not app.config['SNAPSHOT_HTTP_FULL_RESTORE']:
+        return jsonify({'error': 'Whole-database restores are only available through flask restore-snapshot'}), 403
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        request.files['file'].save(path)
+        if scope == 'all':
+            restore_snapshot(path, progress=log_progress('Snapshot restore'))
+        else:
+            _, snapshot_profiles = snapshot_info(path)
+            source = request.form.get('profile_id', type=int)
+            if source is None and len(snapshot_profiles) == 1:
+                source = snapshot_profiles[0]
+            restore_snapshot(path, source or get_profile_id(), get_profile_id())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    finally:
+        os.remove(path)
+    return jsonify({'success': True})
 
-    c.execute('SELECT date, amount, category, description, payment_method FROM expenses WHERE profile_id = ? ORDER BY date DESC', (profile_id,))
-    for row in c.fetchall():
-        writer.writerow(['Expense', row[0], row[1], row[2], row[3], row[4]])
+@app.cli.command('snapshot')
+@click.argument('path', type=click.Path(dir_okay=False))
+@click.option('--profile', 'profile_id', type=int, help='Only include this profile.')
+def snapshot_command(path, profile_id):
+    """Write a consistent copy of the live database to PATH."""
+    def progress(status, remaining, total):
+        click.echo(f'\r{total - remaining}/{total} pages', nl=False)
+    pages = write_snapshot(path, profile_id, progress)
+    click.echo(f'\nSnapshot written to {path} ({pages} pages).')
+
+@app.cli.command('restore-snapshot')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--profile', 'profile_id', type=int, help='Only restore this profile from the snapshot.')
+@click.option('--into', 'target_profile_id', type=int, help='Restore the profile into this profile id.')
+def restore_snapshot_command(path, profile_id, target_profile_id):
+    """Restore the whole database, or one profile, from a snapshot."""
+    try:
+        restore_snapshot(path, profile_id, target_profile_id)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo('Snapshot restored.')
+
+@app.cli.command('rebuild-rollups')
+@click.option('--profile', 'profile_id', type=int, help='Only rebuild this profile.')
+def rebuild_rollups_command(profile_id):
+    """Recompute the daily expense/income rollups from the raw rows."""
+    with pool.connection() as conn:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        rebuild_rollups(c, profile_id)
+        c.execute('SELECT id FROM profiles')
+        for pid, in c.fetchall():
+            if profile_id is None or pid == profile_id:
+                bump_data_version(c, pid)
+        conn.commit()
+    click.echo('Rollups rebuilt.')
+
+@contextmanager
+def scratch_db(name):
+    # Points the app at a fresh, migrated database in a temporary directory for a
+    # check or bench command, and yields a direct connection to it
+    with tempfile.TemporaryDirectory() as tmp:
+        app.config['DATABASE'] = os.path.join(tmp, name)
+        init_db()
+        conn = connect_db()
+        try:
+            yield conn
+        finally:
+            conn.close()
 
-    c.execute('SELECT date, amount, source, type FROM income WHERE profile_id = ? ORDER BY date DESC', (profile_id,))
-    for row in c.fetchall():
-        writer.writerow(['Income', row[0], row[1], row[2], row[3]])
+def best_of(fn, repeat):
+    # Fastest of `repeat` runs, in milliseconds
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', '-v', is_flag=True, help='Print every query plan.')
+def check_query_plans_command(verbose):
+    """Fail if any supported /api/expenses filter combination scans a whole table or sorts its page."""
+    import itertools
+
+    samples = {'category': 'Food', 'payment_method': 'UPI', 'start': '2024-01-01', 'end': '2024-12-31',
+               'min_amount': '10', 'max_amount': '500', 'q': 'coffee'}
+    failures = 0
+    checked = 0
+    with scratch_db('plans.db') as conn:
+        for size in range(len(samples) + 1):
+            for names in itertools.combinations(samples, size):
+                where, params = expense_filter_sql(1, {name: samples[name] for name in names})
+                for after in (None, ('2024-06-01', 100)):
+                    query = f'SELECT * FROM {EXPENSE_ROWS} WHERE {where}'
+                    query_params = params
+                    if after:
+                        query += ' AND (date, id) < (?, ?)'
+                        query_params = (*params, *after)
+                    query += ' ORDER BY date DESC, id DESC LIMIT ?'
+                    plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, (*query_params, 51))]
+                    # A keyset page must come off an index in (date, id) order: a temp
+                    # B-tree sorts every matching row before the LIMIT applies
+                    scans = [step for step in plan if step.startswith('SCAN')]
+                    sorts = [step for step in plan if 'TEMP B-TREE' in step]
+                    checked += 1
+                    label = ', '.join(names) or '(no filters)'
+                    if after:
+                        label += ' + cursor'
+                    if scans or sorts:
+                        failures += 1
+                        click.echo(f'{"FULL SCAN" if scans else "SORT":<10} {label}: {"; ".join(plan)}')
+                    elif verbose:
+                        click.echo(f'ok         {label}: {"; ".join(plan)}')
+
+    click.echo(f'{checked} filter combinations checked, {failures} full scans or sorts.')
+    if failures:
+        raise SystemExit(1)
+
+@app.cli.command('check-snapshot-restore')
+def check_snapshot_restore_command():
+    """Fail if a cached result or ETag from before a whole-database restore is served after it."""
+    with scratch_db('restore.db'):
+        client = app.test_client()
+
+        def add_expense(amount):
+            client.post('/api/expenses', json={'amount': amount, 'paymentMethod': 'UPI',
+                                               'category': 'Food', 'date': '2024-03-01'})
+
+        add_expense(10)
+        path = os.path.join(os.path.dirname(app.config['DATABASE']), 'snapshot.db')
+        write_snapshot(path)
+        for _ in range(5):
+            add_expense(10)
+        client.get('/api/summary?period=all')
+        etag = client.get('/api/expenses').headers['ETag']
+        with pool.connection() as conn:
+            handed_out = max_version(conn.cursor())
+
+        restore_snapshot(path)
+        # Keep writing until the snapshot's own counters would have climbed back
+        # past every version handed out before the restore
+        total = 10
+        failures = 0
+        for _ in range(handed_out + 1):
+            add_expense(1)
+            total += 1
+            summary = client.get('/api/summary?period=all').get_json()
+            expenses = client.get('/api/expenses', headers={'If-None-Match': etag})
+            if summary['total_expenses'] != total:
+                failures += 1
+                click.echo(f'STALE      /api/summary total {summary["total_expenses"]}, expected {total}')
+            if expenses.status_code == 304:
+                failures += 1
+                click.echo('STALE      /api/expenses answered 304 to a pre-restore ETag')
+
+    click.echo(f'{handed_out + 1} writes after restore checked, {failures} stale responses.')
+    if failures:
+        raise SystemExit(1)
+
+@app.cli.command('check-merchant-matching')
+def check_merchant_matching_command():
+    """Fail if statement merchant variants split, or distinct merchants sharing a prefix merge."""
+    same = [
+        ('SWIGGY ORDER 48213 BANGALORE', 'Swiggy'),
+        ('ZOMATO LTD', 'Zomato Online Order'),
+        ('STARBUCKS COFFEE', 'STARBUCKS COFFE'),
+        ('AMAZON SELLER SERVICES PVT LTD', 'AMAZON SELLER SERVIC'),
+        ('BIGBASKET', 'BIG BASKET'),
+    ]
+    distinct = [
+        ('Swiggy', 'Swiggy Instamart'),
+        ('Uber', 'Uber Eats'),
+        ('Amazon', 'Amazon Pay'),
+        ('Airtel', 'Airtel Payments Bank'),
+        ('Reliance Digital', 'Reliance Fresh'),
+        ('Dominos', 'Dominos Pizza'),
+    ]
+    failures = 0
+    with scratch_db('merchants.db') as conn:
+        c = conn.cursor()
+        for expected, pairs in ((True, same), (False, distinct)):
+            for a, b in pairs:
+                # Both in one import, and each order across two imports
+                for batches in ([[a, b]], [[a], [b]], [[b], [a]]):
+                    c.execute('BEGIN')
+                    ids = [merchant_id for batch in batches
+                           for merchant_id in MerchantIndex(c, 1).resolve_many(batch)]
+                    conn.rollback()
+                    if (ids[0] == ids[1]) != expected:
+                        failures += 1
+                        click.echo(f'{"SPLIT" if expected else "MERGED":<10} {a!r} / {b!r} '
+                                   f'({" then ".join(map(str, batches))})')
+
+    click.echo(f'{len(same) + len(distinct)} merchant pairs checked, {failures} mismatches.')
+    if failures:
+        raise SystemExit(1)
+
+@app.cli.command('import-statements')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option('--profile', 'profile_id', default=1, show_default=True, help='Profile to import into.')
+@click.option('--card', default=None, help="Card name for every file (default: each file's layout).")
+@click.option('--workers', default=None, type=int, help='Parse processes (default: IMPORT_PARSE_PROCESSES).')
+def import_statements_command(paths, profile_id, card, workers):
+    """Import statement CSVs, parsing them in parallel and writing through one connection."""
+    started = time.perf_counter()
+    totals = defaultdict(int)
+    with parse_pool(workers or app.config['IMPORT_PARSE_PROCESSES']) as executor:
+        futures = {}
+        for path in paths:
+            with open(path, 'rb') as f:
+                futures[executor.submit(parse_statement_file, f.read(), profile_id, card)] = path
+        with pool.connection() as conn:
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    rows, report = future.result()
+                except ValueError as e:
+                    click.echo(f'{path}: {e}', err=True)
+                    totals['failed'] += 1
+                    continue
+                write_statement(conn, profile_id, report['card_name'], rows, report)
+                for key in ('imported', 'skipped_duplicates', 'skipped_credits', 'rejected_count'):
+                    totals[key] += report[key]
+                click.echo(f'{path}: {report["layout"]}, {report["imported"]:,} imported, '
+                           f'{report["skipped_duplicates"]:,} duplicates, {report["rejected_count"]:,} rejected')
+    elapsed = time.perf_counter() - started
+    click.echo(f'{len(paths)} files, {totals["imported"]:,} rows imported in {elapsed:.2f} s '
+               f'({totals["imported"] / elapsed:,.0f} rows/s)')
+    if totals['failed']:
+        raise SystemExit(1)
+
+@app.cli.command('bench-stream')
+@click.option('--rows', default=200_000, show_default=True, help='Expense rows in the largest history.')
+def bench_stream_command(rows):
+    """Check that streamed list responses use flat memory as history grows."""
+    import tracemalloc
+
+    def peak_kib(client, url):
+        tracemalloc.start()
+        response = client.get(url, buffered=False)
+        size = sum(len(chunk) for chunk in response.iter_encoded())
+        response.close()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, peak / 1024
+
+    with scratch_db('stream.db') as conn:
+        client = app.test_client()
+        results = []
+        inserted = 0
+        _, _, method_id, category_id, _ = encode_expenses(conn.cursor(), 1, [(0, '', 'UPI', 'Food', '')])[0]
+        for history in (rows // 8, rows // 4, rows // 2, rows):
+            conn.executemany('''INSERT INTO expenses (profile_id, amount, description, payment_method_id, category_id, date, timestamp)
+                                VALUES (1, 99.5, 'Streaming benchmark row', ?, ?, ?, '')''',
+                             ((method_id, category_id, f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}')
+                              for i in range(history - inserted)))
+            conn.commit()
+            inserted = history
+            size, streamed = peak_kib(client, '/api/expenses?stream=1')
+            results.append(streamed)
+            click.echo(f'{history:>9,} rows  {size / 1024 / 1024:7.1f} MiB body  peak {streamed:8.0f} KiB streamed')
+
+    if results[-1] > 2 * results[0]:
+        click.echo('Streamed peak memory grows with history.')
+        raise SystemExit(1)
+    click.echo('Streamed peak memory is flat.')
+
+@app.cli.command('bench-import')
+@click.option('--lines', default=100_000, show_default=True, help='Rows in the generated statement.')
+def bench_import_command(lines):
+    """Time a statement import: row-at-a-time inserts versus the batched importer."""
+    import random
+
+    rng = random.Random(7)
+    merchants = ['SWIGGY', 'ZOMATO', 'AMAZON', 'FLIPKART', 'UBER', 'BIGBASKET', 'NETFLIX', 'AIRTEL']
+    rows = ['Date,Merchant,Amount,Category']
+    for i in range(lines):
+        rows.append(f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d},{rng.choice(merchants)} {i},"{rng.uniform(10, 9999):,.2f}",Shopping')
+    statement = '\n'.join(rows) + '\n'
+    click.echo(f'Statement: {lines:,} lines, {len(statement) / 1024 / 1024:.1f} MiB')
+
+    def row_at_a_time(conn):
+        c = conn.cursor()
+        for row in csv.DictReader(io.StringIO(statement)):
+            try:
+                date_str = row.get('Date', row.get('date', ''))
+                merchant = row.get('Merchant', row.get('merchant', row.get('Description', '')))
+                amount = float(row.get('Amount', row.get('amount', '0')).replace(',', '').replace('₹', ''))
+                category = row.get('Category', row.get('category', 'Miscellaneous'))
+                c.execute('''INSERT INTO credit_statements
+                            (profile_id, card_name, amount, merchant, category, date, uploaded_date)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                          (1, 'bench.csv', abs(amount), merchant, category, date_str, datetime.now().isoformat()))
+                record = encode_expenses(c, 1, [(abs(amount), merchant, 'Credit Card', category, date_str)])[0]
+                c.execute('''INSERT INTO expenses
+                            (profile_id, amount, description, payment_method_id, category_id, date, timestamp)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                          (1, *record, datetime.now().isoformat()))
+                update_expense_rollup(c, 1, [(date_str, record[3], record[2], 1, abs(amount))])
+            except Exception:
+                continue
+        conn.commit()
 
-    conn.close()
+    def batched(conn):
+        report = import_statement(conn, 1, 'bench.csv', io.StringIO(statement))
+        assert report['imported'] == lines, report
+
+    for name, run in (('row at a time', row_at_a_time), ('batched', batched)):
+        with scratch_db(name.replace(' ', '_') + '.db') as conn:
+            started = time.perf_counter()
+            run(conn)
+            elapsed = time.perf_counter() - started
+        click.echo(f'{name:<14} {elapsed:8.2f} s  {lines / elapsed:10,.0f} rows/s')
+
+@app.cli.command('bench-parsers')
+@click.option('--lines', default=200_000, show_default=True, help='Rows in each generated statement.')
+def bench_parsers_command(lines):
+    """Measure parsing throughput for each built-in statement layout."""
+    import random
+
+    rng = random.Random(11)
+    merchants = ['SWIGGY', 'ZOMATO', 'AMAZON', 'FLIPKART', 'UBER', 'BIGBASKET', 'NETFLIX', 'AIRTEL']
+    start = date(2024, 1, 1)
+
+    def generate(layout):
+        header = [layout.date[0], layout.merchant[0], (layout.amount or layout.debit)[0]]
+        if layout.debit:
+            header.append('credit')
+        if layout.indicator:
+            header.append(layout.indicator[0])
+        if layout.category:
+            header.append(layout.category[0])
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(header)
+        for i in range(lines):
+            day = start + timedelta(days=i % 366)
+            credit = i % 20 == 0
+            amount = f'{layout.currency}{rng.uniform(10, 9999):,.2f}'
+            row = [day.strftime(layout.date_format) if layout.date_format else day.isoformat(),
+                   f'{rng.choice(merchants)} {i}']
+            if layout.debit:
+                row += ['', amount] if credit else [amount, '']
+            else:
+                row.append(amount)
+            if layout.indicator:
+                row.append(sorted(layout.credit_marks)[0].upper() if credit else 'DR')
+            if layout.category:
+                row.append('Shopping')
+            writer.writerow(row)
+        return out.getvalue()
+
+    def legacy(text):
+        # The per-row lookup chains the layouts replaced
+        parsed = 0
+        for row in csv.DictReader(io.StringIO(text)):
+            row.get('Date', row.get('date', ''))
+            row.get('Merchant', row.get('merchant', row.get('Description', '')))
+            abs(float(row.get('Amount', row.get('amount', '0')).replace(',', '').replace('₹', '')))
+            row.get('Category', row.get('category', 'Miscellaneous'))
+            parsed += 1
+        return parsed
+
+    def compiled(text):
+        reader = csv.reader(io.StringIO(text))
+        _, convert = detect_layout(next(reader))
+        return sum(1 for row in reader if convert(row) is not None)
+
+    def timed(parse, text):
+        started = time.perf_counter()
+        parsed = parse(text)
+        return parsed, time.perf_counter() - started
+
+    for layout in STATEMENT_LAYOUTS:
+        text = generate(layout)
+        detected, _ = detect_layout(next(csv.reader(io.StringIO(text))))
+        assert detected is layout, (layout.name, detected.name)
+        parsed, elapsed = timed(compiled, text)
+        click.echo(f'{layout.name:<18} {parsed:>9,} debits  {elapsed:6.2f} s  {lines / elapsed:10,.0f} rows/s')
+        if layout.name == 'generic':
+            _, elapsed = timed(legacy, text)
+            click.echo(f'{"generic (legacy)":<18} {lines:>9,} rows    {elapsed:6.2f} s  {lines / elapsed:10,.0f} rows/s')
+
+@app.cli.command('bench-rules')
+@click.option('--rules', 'rule_count', default=1000, show_default=True, help='Categorization rules to compile.')
+@click.option('--rows', default=200_000, show_default=True, help='Merchant strings to categorize.')
+def bench_rules_command(rule_count, rows):
+    """Measure categorization throughput of the compiled rule matcher."""
+    import random
+
+    rng = random.Random(5)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9)))
+             for _ in range(rule_count * 2)]
+    kinds = ['keyword'] * 70 + ['prefix'] * 20 + ['exact'] * 8 + ['regex'] * 2
+    rules = []
+    for rule_id in range(1, rule_count + 1):
+        kind = rng.choice(kinds)
+        word = words[rule_id]
+        pattern = rf'\b{word}\d*\b' if kind == 'regex' else word
+        rules.append((rule_id, kind, pattern, f'Category {rule_id % 40}', rng.choice([0, 0, 0, 1])))
+    texts = [f'{rng.choice(words).upper()}*{rng.choice(["ORDER", "POS", "UPI"])} {rng.randint(1, 99999)} '
+             f'{rng.choice(["BANGALORE", "MUMBAI", "DELHI"])}' for _ in range(rows)]
+
+    started = time.perf_counter()
+    matcher = RuleMatcher(rules)
+    click.echo(f'Compiled {rule_count:,} rules in {(time.perf_counter() - started) * 1000:.1f} ms '
+               f'({len(matcher.goto):,} keyword states)')
+
+    started = time.perf_counter()
+    matched = sum(1 for text in texts if matcher.match(text))
+    elapsed = time.perf_counter() - started
+    click.echo(f'{"compiled matcher":<18} {rows / elapsed:12,.0f} rows/s  ({matched:,} matched)')
+
+    # Baseline: every rule tried against every row
+    compiled = [(kind, re.compile(pattern, re.IGNORECASE) if kind == 'regex' else normalize_merchant(pattern), category)
+                for _, kind, pattern, category, _ in rules]
+    def linear(text):
+        norm = normalize_merchant(text)
+        padded = f' {norm} '
+        for kind, pattern, category in compiled:
+            if ((kind == 'exact' and norm == pattern) or (kind == 'prefix' and norm.startswith(pattern))
+                    or (kind == 'keyword' and f' {pattern} ' in padded) or (kind == 'regex' and pattern.search(text))):
+                return category
+        return None
+    sample = texts[:max(rows // 20, 1)]
+    started = time.perf_counter()
+    for text in sample:
+        linear(text)
+    elapsed = time.perf_counter() - started
+    click.echo(f'{"linear scan":<18} {len(sample) / elapsed:12,.0f} rows/s')
+
+@app.cli.command('bench-analytics')
+@click.option('--rows', default=1_000_000, show_default=True, help='Expense rows in the benchmark profile.')
+@click.option('--years', default=5, show_default=True, help='Years of history the rows are spread over.')
+@click.option('--repeat', default=5, show_default=True, help='Timed runs per query plan.')
+def bench_analytics_command(rows, years, repeat):
+    """Compare the seven-query analytics plan with the single-pass plan."""
+    import random
+
+    seven_queries = [
+        'SELECT SUM({amount}) FROM {table} WHERE profile_id = ? AND date >= ? AND date <= ?',
+        'SELECT {count} FROM {table} WHERE profile_id = ? AND date >= ? AND date <= ?',
+        'SELECT category_id, SUM({amount}) FROM {table} WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY category_id',
+        'SELECT payment_method_id, SUM({amount}) FROM {table} WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY payment_method_id',
+        'SELECT date, SUM({amount}) FROM {table} WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY date ORDER BY date',
+        "SELECT strftime('%Y-%m', date) as month, SUM({amount}) FROM {table} WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY month ORDER BY month",
+        "SELECT strftime('%Y-%m', date) as month, SUM({amount}) FROM {income} WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY month ORDER BY month",
+    ]
+    raw = {'table': 'expenses', 'income': 'income', 'amount': 'amount', 'count': 'COUNT(*)'}
+    rollup = {'table': 'expense_daily_rollup', 'income': 'income_daily_rollup', 'amount': 'total', 'count': 'SUM(txn_count)'}
+
+    with scratch_db('bench.db') as conn:
+        c = conn.cursor()
 
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode()),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'expenses_export_{datetime.now().strftime("%Y%m%d")}.csv'
-    )
+        click.echo(f'Generating {rows:,} expenses over {years} years...')
+        rng = random.Random(42)
+        end = date.today()
+        days = [(end - timedelta(days=i)).isoformat() for i in range(365 * years)]
+        categories = ['Food', 'Transport', 'Utilities', 'Entertainment', 'Shopping', 'Healthcare', 'Miscellaneous']
+        methods = ['Cash', 'UPI', 'Debit Card', 'Credit Card']
+        stamp = datetime.now().isoformat()
+        method_ids = list(dimension_ids(c, 'payment_methods', 1, methods).values())
+        category_ids = list(dimension_ids(c, 'categories', 1, categories).values())
+        c.executemany('''INSERT INTO expenses (profile_id, amount, description, payment_method_id, category_id, date, timestamp)
+                         VALUES (1, ?, '', ?, ?, ?, ?)''',
+                      ((round(rng.uniform(10, 5000), 2), rng.choice(method_ids), rng.choice(category_ids), rng.choice(days), stamp)
+                       for _ in range(rows)))
+        c.executemany("INSERT INTO income (profile_id, amount, source, type, date, timestamp) VALUES (1, ?, 'Job', 'Salary', ?, ?)",
+                      ((50000, d, stamp) for d in days[::30]))
+        rebuild_rollups(c)
+        conn.commit()
+        c.execute('ANALYZE')
+
+        params = (1, days[-1], end.isoformat())
+        plans = [
+            ('seven queries, raw rows', lambda: [c.execute(q.format(**raw), params).fetchall() for q in seven_queries]),
+            ('seven queries, rollups', lambda: [c.execute(q.format(**rollup), params).fetchall() for q in seven_queries]),
+            ('single pass, rollups', lambda: aggregate_period(c, *params)),
+        ]
+        results = [(name, best_of(fn, repeat)) for name, fn in plans]
+        baseline = results[0][1]
+        for name, ms in results:
+            click.echo(f'{name:<26} {ms:10.1f} ms  {baseline / ms:6.1f}x')
+
+@app.cli.command('bench-dimensions')
+@click.option('--rows', default=500_000, show_default=True, help='Expense rows in the benchmark profile.')
+@click.option('--repeat', default=5, show_default=True, help='Timed runs per operation.')
+def bench_dimensions_command(rows, repeat):
+    """Compare expenses keyed by category/payment method names with the id-keyed layout."""
+    import random
+
+    # The layout before dimension tables: names on every row, the same four indexes over them
+    text_indexes = {
+        'date_category': 'profile_id, date, category, amount',
+        'date_payment': 'profile_id, date, payment_method, amount',
+        'category_date': 'profile_id, category, date',
+        'payment_date': 'profile_id, payment_method, date',
+    }
+    id_indexes = ['idx_expenses_profile_date_category', 'idx_expenses_profile_date_payment',
+                  'idx_expenses_profile_category_date', 'idx_expenses_profile_payment_date']
+
+    with scratch_db('bench.db') as conn:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE text_expenses
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT, profile_id INTEGER, amount REAL NOT NULL,
+                      description TEXT, payment_method TEXT, category TEXT, date TEXT, timestamp TEXT,
+                      import_job_id INTEGER)''')
+        for name, columns in text_indexes.items():
+            c.execute(f'CREATE INDEX idx_text_expenses_{name} ON text_expenses ({columns})')
+
+        click.echo(f'Generating {rows:,} expenses in both layouts...')
+        rng = random.Random(19)
+        end = date.today()
+        days = [(end - timedelta(days=i)).isoformat() for i in range(365 * 3)]
+        categories = ['Food', 'Transport', 'Utilities', 'Entertainment', 'Shopping', 'Healthcare', 'Miscellaneous']
+        methods = ['Cash', 'UPI', 'Debit Card', 'Credit Card']
+        descriptions = ['Lunch', 'Cab to office', 'Electricity bill', 'Movie tickets', 'Groceries', 'Pharmacy']
+        records = [(round(rng.uniform(10, 5000), 2), rng.choice(descriptions), rng.choice(methods),
+                    rng.choice(categories), rng.choice(days)) for _ in range(rows)]
+        stamp = datetime.now().isoformat()
+        c.execute('BEGIN')
+        c.executemany('''INSERT INTO text_expenses (profile_id, amount, description, payment_method, category, date, timestamp)
+                         VALUES (1, ?, ?, ?, ?, ?, ?)''', [(*record, stamp) for record in records])
+        c.executemany('''INSERT INTO expenses (profile_id, amount, description, payment_method_id, category_id, date, timestamp)
+                         VALUES (1, ?, ?, ?, ?, ?, ?)''',
+                      [(*record, stamp) for record in encode_expenses(c, 1, records)])
+        conn.commit()
+        c.execute('ANALYZE')
+
+        c.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+        sizes = dict(c.fetchall())
+        footprint = [
+            ('table', sizes['text_expenses'], sizes['expenses']),
+            ('four indexes', sum(sizes[f'idx_text_expenses_{name}'] for name in text_indexes),
+             sum(sizes[name] for name in id_indexes)),
+            ('dimension tables', 0, sizes['categories'] + sizes['payment_methods']),
+        ]
+        click.echo(f'{"storage":<26} {"names":>10} {"ids":>10}')
+        for label, text_bytes, id_bytes in footprint:
+            click.echo(f'{label:<26} {text_bytes / 1024 / 1024:6.1f} MiB {id_bytes / 1024 / 1024:6.1f} MiB')
+        text_total = sum(row[1] for row in footprint)
+        id_total = sum(row[2] for row in footprint)
+        click.echo(f'{"total":<26} {text_total / 1024 / 1024:6.1f} MiB {id_total / 1024 / 1024:6.1f} MiB  '
+                   f'{1 - id_total / text_total:.0%} smaller')
+
+        year = (1, (end - timedelta(days=365)).isoformat(), end.isoformat())
+        where, params = expense_filter_sql(1, {'category': 'Food'})
+
+        def rename(sql, params):
+            c.execute('BEGIN')
+            c.execute(sql, params)
+            conn.rollback()
+
+        operations = [
+            ('group by category, 1 year',
+             lambda: c.execute('''SELECT category, SUM(amount) FROM text_expenses
+                                  WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY category''', year).fetchall(),
+             lambda: dimension_totals(c, 'categories', 1, dict(c.execute(
+                 '''SELECT category_id, SUM(amount) FROM expenses
+                    WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY category_id''', year).fetchall()))),
+            ('group by payment, 1 year',
+             lambda: c.execute('''SELECT payment_method, SUM(amount) FROM text_expenses
+                                  WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY payment_method''', year).fetchall(),
+             lambda: dimension_totals(c, 'payment_methods', 1, dict(c.execute(
+                 '''SELECT payment_method_id, SUM(amount) FROM expenses
+                    WHERE profile_id = ? AND date >= ? AND date <= ? GROUP BY payment_method_id''', year).fetchall()))),
+            ('page filtered by category',
+             lambda: c.execute('''SELECT * FROM text_expenses WHERE profile_id = 1 AND category = 'Food'
+                                  ORDER BY date DESC, id DESC LIMIT 51''').fetchall(),
+             lambda: fetch_page(c, f'SELECT * FROM {EXPENSE_ROWS} WHERE {where}', params, 50, None)),
+            ('rename a category',
+             lambda: rename("UPDATE text_expenses SET category = 'Dining' WHERE profile_id = 1 AND category = 'Food'", ()),
+             lambda: rename("UPDATE categories SET name = 'Dining' WHERE profile_id = 1 AND name = 'Food'", ())),
+        ]
+
+        click.echo(f'{"operation":<26} {"names":>10} {"ids":>10}')
+        for label, by_name, by_id in operations:
+            text_ms, id_ms = best_of(by_name, repeat), best_of(by_id, repeat)
+            click.echo(f'{label:<26} {text_ms:7.2f} ms {id_ms:7.2f} ms  {text_ms / id_ms:6.1f}x')
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)